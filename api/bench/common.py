@@ -0,0 +1,22 @@
+import subprocess
+
+import numpy as np
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+
+def summarize(samples: list[float]) -> dict:
+    if len(samples) == 0:
+        return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    ms = np.array(samples) * 1000
+    return {
+        'mean': float(ms.mean()),
+        'p50': float(np.percentile(ms, 50)),
+        'p95': float(np.percentile(ms, 95)),
+        'p99': float(np.percentile(ms, 99)),
+    }
@@ -0,0 +1,117 @@
+# @NOTE: Poll latency of the inferences cursor API as history grows (PostgreSQL)
+#        DATABASE_URL=postgresql://... python -m bench.query_plan --steps 100000,1000000,5000000 --output query_plan.json
+#        Seeds rows for negative source ids and removes them afterwards, unless --keep is given.
+#        Measures crud.get_inference_rows, which the endpoints use. With --storage packed hits are seeded
+#        as hits_packed on the inference rows, so the unpacking is measured too.
+import argparse
+import json
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text
+
+from bench.common import git_commit, summarize
+from src import crud, packing, schemas
+from src.database import SessionLocal
+
+FPS = 25
+POLL_WINDOW = 2.0  # @NOTE: Seconds of fresh data a live viewer asks for
+
+
+def seed(db, n_from: int, n_to: int, n_sources: int, t0: float, storage: str):
+    # @NOTE: Rows are spread round-robin over n_sources bench sources, FPS rows per second each.
+    #        Every 10th frame has a hit.
+    hit = schemas.InferenceHitBase(x=0.5, y=0.5, w=0.1, h=0.2, c=0.9, track_id=1)
+    db.execute(text('''
+        INSERT INTO inferences (t, source_kind, source_id, hits_packed)
+        SELECT :t0 + (g / :n_sources) / CAST(:fps AS double precision), 'Video', -1 - (g % :n_sources),
+               CASE WHEN g % 10 = 0 THEN CAST(:hits_packed AS bytea) END
+        FROM generate_series(:n_from, :n_to - 1) AS g
+    '''), dict(t0=t0, n_sources=n_sources, fps=FPS, n_from=n_from, n_to=n_to,
+                hits_packed=packing.pack_hits([hit]) if storage == 'packed' else None))
+    if storage == 'rows':
+        db.execute(text('''
+            INSERT INTO inference_hits (x, y, w, h, c, track_id, inference_id, t, source_kind)
+            SELECT 0.5, 0.5, 0.1, 0.2, 0.9, 1, id, t, source_kind FROM inferences
+            WHERE source_id < 0 AND id % 10 = 0 AND id > coalesce((SELECT max(inference_id) FROM inference_hits), 0)
+        '''))
+    db.commit()
+    db.execute(text('ANALYZE inferences'))
+    db.execute(text('ANALYZE inference_hits'))
+    db.commit()
+
+
+def cleanup(db):
+    db.execute(text('DELETE FROM inference_hits WHERE inference_id IN (SELECT id FROM inferences WHERE source_id < 0)'))
+    db.execute(text('DELETE FROM inferences WHERE source_id < 0'))
+    db.commit()
+
+
+def explain(db, since_t: float, limit: int) -> dict:
+    inference_id_to, _ = crud.get_wiped_ids(db, schemas.SourceKind.Video, -1)
+    row = db.execute(text('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + crud.INFERENCE_ROWS_QUERY.text),
+                     dict(source_kind=schemas.SourceKind.Video.name, source_id=-1, inference_id_to=inference_id_to,
+                          since_t=since_t, limit=limit)).scalar()
+    return row[0] if isinstance(row, list) else json.loads(row)[0]
+
+
+def measure(db, since_t: float, limit: int, n_polls: int) -> dict:
+    samples = []
+    for _ in range(n_polls):
+        t0 = time.perf_counter()
+        crud.get_inference_rows(db, schemas.SourceKind.Video, -1, since_t, limit)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark inferences cursor queries against history size')
+    parser.add_argument('--steps', default='100000,1000000,5000000', help='Total seeded rows at each step')
+    parser.add_argument('--sources', type=int, default=10)
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--storage', choices=['rows', 'packed'], default='rows', help='How seeded hits are stored')
+    parser.add_argument('--keep', action='store_true', help='Keep seeded rows')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    if db.get_bind().dialect.name != 'postgresql':
+        raise SystemExit('Query plan benchmark needs PostgreSQL')
+
+    t0 = time.time()
+    runs = []
+    n_seeded = 0
+    try:
+        for n_rows in [int(it) for it in args.steps.split(',')]:
+            seed(db, n_seeded, n_rows, args.sources, t0, args.storage)
+            n_seeded = n_rows
+
+            t_last = db.execute(text("SELECT max(t) FROM inferences WHERE source_kind = 'Video' AND source_id = -1")).scalar()
+            run = {
+                'rows': n_rows,
+                'live_poll': measure(db, t_last - POLL_WINDOW, args.limit, args.polls),
+                'initial_page': measure(db, 0, args.limit, args.polls),
+                'plan': explain(db, t_last - POLL_WINDOW, args.limit),
+            }
+            runs.append(run)
+            print(f"{n_rows} rows: live p50={run['live_poll']['p50']:.2f}ms p95={run['live_poll']['p95']:.2f}ms, "
+                  f"initial p50={run['initial_page']['p50']:.2f}ms")
+    finally:
+        if not args.keep:
+            cleanup(db)
+        db.close()
+
+    result = {'meta': {'commit': git_commit(), 'time': time.time(), 'storage': args.storage}, 'runs': runs}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# @NOTE: CPU benchmark of the Runner inference pipeline
+#        python -m bench.runner --output runner.json
+#        python -m bench.runner --video ./some.mp4 --resolutions 1280x720
+import argparse
+import json
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from bench.common import git_commit, summarize
+from src.ml.backends import Backend
+from src.ml.guns import POSE_WEIGHTS, PersonCrop, Runner, warm_up
+from src.ml.registry import ModelRegistry
+from src.ml.scheduler import BatchScheduler
+
+STAGES = ['pose', 'crop', 'gun', 'hits']
+
+
+def parse_resolution(value: str) -> tuple[int, int]:
+    w, h = value.lower().split('x')
+    return int(w), int(h)
+
+
+def synthetic_frame(rng: np.random.Generator, w: int, h: int) -> np.ndarray:
+    # @NOTE: Smooth noise, so that resize and letterbox do real work
+    small = rng.integers(0, 255, (max(1, h // 16), max(1, w // 16), 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def synthetic_crowd(rng: np.random.Generator, w: int, h: int, n: int) -> list[PersonCrop]:
+    crops = []
+    for track_id in range(n):
+        cw = int(rng.integers(w // 16, w // 6))
+        ch = int(rng.integers(h // 6, h // 2))
+        l = int(rng.integers(0, w - cw))
+        t = int(rng.integers(0, h - ch))
+        crops.append(PersonCrop(track_id + 1, l, t, l + cw, t + ch))
+    return crops
+
+
+def record(runner: Runner, stages: dict[str, list[float]], totals: list[float], total: float):
+    for stage in STAGES:
+        stages[stage].append(runner.timings.get(stage, 0.0))
+    totals.append(total)
+
+
+def bench_synthetic(runner: Runner, w: int, h: int, crowd: int, n_frames: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    frame = synthetic_frame(rng, w, h)
+    crops = synthetic_crowd(rng, w, h, crowd)
+
+    stages = {stage: [] for stage in STAGES}
+    totals = []
+    t_start = time.perf_counter()
+    for _ in range(n_frames):
+        # @NOTE: Pose runs on the frame, but the crowd is synthetic, since the pose model finds nobody in noise
+        runner.timings = {}
+        t0 = time.perf_counter()
+        runner.scheduler.predict(frame)
+        runner.timed('pose', t0)
+        runner.detect_guns(frame, crops)
+        record(runner, stages, totals, time.perf_counter() - t0)
+    elapsed = time.perf_counter() - t_start
+
+    return {
+        'source': 'synthetic',
+        'resolution': f'{w}x{h}',
+        'crowd': crowd,
+        'frames': n_frames,
+        'fps': n_frames / elapsed,
+        'stages': {stage: summarize(samples) for stage, samples in stages.items()},
+        'total': summarize(totals),
+    }
+
+
+def bench_video(runner: Runner, video: str, w: int, h: int, n_frames: int) -> dict:
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < n_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA))
+    cap.release()
+
+    stages = {stage: [] for stage in STAGES}
+    totals = []
+    t_start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        t0 = time.perf_counter()
+        runner.infer(frame, i)
+        record(runner, stages, totals, time.perf_counter() - t0)
+    elapsed = time.perf_counter() - t_start
+
+    return {
+        'source': video,
+        'resolution': f'{w}x{h}',
+        'crowd': None,
+        'frames': len(frames),
+        'fps': len(frames) / elapsed if elapsed > 0 else 0.0,
+        'stages': {stage: summarize(samples) for stage, samples in stages.items()},
+        'total': summarize(totals),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Runner.infer stages')
+    parser.add_argument('--backend', default=Backend.TorchCpu.value, choices=[it.value for it in Backend])
+    parser.add_argument('--resolutions', default='640x360,1280x720,1920x1080')
+    parser.add_argument('--crowd', default='0,1,5,15', help='Synthetic crowd sizes, ignored with --video')
+    parser.add_argument('--video', default=None, help='Use recorded frames instead of synthetic ones')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--reuse', action='store_true', help='Keep per-track gun result reuse enabled')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    args = parser.parse_args()
+
+    models = ModelRegistry(Backend(args.backend))
+    warm_up(models)
+    scheduler = BatchScheduler(POSE_WEIGHTS, 'pose', models=models)
+
+    runs = []
+    for resolution in args.resolutions.split(','):
+        w, h = parse_resolution(resolution)
+        crowds = [None] if args.video else [int(it) for it in args.crowd.split(',')]
+        for crowd in crowds:
+            # @NOTE: Fresh runner per run, so that tracker and reuse cache do not leak between runs
+            runner = Runner(models=models, scheduler=scheduler)
+            if not args.reuse:
+                runner.reuse_frames = 1
+            if args.video:
+                run = bench_video(runner, args.video, w, h, args.frames)
+            else:
+                run = bench_synthetic(runner, w, h, crowd, args.frames, args.seed)
+            runs.append(run)
+            stages = ' '.join(f"{stage}={run['stages'][stage]['p50']:.1f}" for stage in STAGES)
+            print(f"{run['resolution']} crowd={run['crowd']} fps={run['fps']:.1f} p50 ms: {stages}")
+
+    result = {
+        'meta': {
+            'commit': git_commit(),
+            'backend': args.backend,
+            'reuse': args.reuse,
+            'time': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# @NOTE: Inferences endpoint serialization, ORM + Pydantic (previous path) against raw rows + fast JSON encoder,
+#        and the size of the msgpack columnar response
+#        DATABASE_URL=... python -m bench.serialization --sizes 1000,10000,100000 --output serialization.json
+#        Seeds rows for a negative source id and removes them afterwards, unless --keep is given
+import argparse
+import json
+import random
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from pydantic import TypeAdapter
+from sqlalchemy import text
+from starlette.responses import JSONResponse
+
+from bench.common import git_commit, summarize
+from src import crud, schemas
+from src.database import SessionLocal
+from src.encoding import encode_json, encode_msgpack_columns
+
+SOURCE_ID = -3
+FPS = 25
+SEED_BATCH_SIZE = 5000
+
+adapter = TypeAdapter(list[schemas.Inference])
+
+
+def seed(db, n_rows: int, t0: float, seed: int):
+    # @NOTE: Zero to three hits per frame, like a busy camera
+    rng = random.Random(seed)
+    for n_from in range(0, n_rows, SEED_BATCH_SIZE):
+        inferences = []
+        for n in range(n_from, min(n_rows, n_from + SEED_BATCH_SIZE)):
+            hits = [schemas.InferenceHitCreate(x=rng.random(), y=rng.random(), w=rng.random() / 4, h=rng.random() / 2,
+                                               c=rng.random(), track_id=rng.randint(1, 20))
+                    for _ in range(rng.randint(0, 3))]
+            inferences.append(schemas.InferenceCreate(t=t0 + n / FPS, hits=hits, source_kind=schemas.SourceKind.Video,
+                                                      source_id=SOURCE_ID))
+        crud.create_inferences(db, inferences)
+
+
+def cleanup(db):
+    db.execute(text(f"DELETE FROM inference_hits WHERE inference_id IN (SELECT id FROM inferences WHERE source_id = {SOURCE_ID})"))
+    db.execute(text(f'DELETE FROM inferences WHERE source_id = {SOURCE_ID}'))
+    db.commit()
+
+
+# @NOTE: What FastAPI does with a response model: validate, dump in json mode, json.dumps
+def orm_response(db, limit: int) -> bytes:
+    db_inferences = crud.get_inferences(db, schemas.SourceKind.Video, SOURCE_ID, 0, limit)
+    content = adapter.dump_python(adapter.validate_python(db_inferences, from_attributes=True), mode='json')
+    return JSONResponse(content).body
+
+
+def raw_response(db, limit: int) -> bytes:
+    return encode_json(crud.get_inference_rows(db, schemas.SourceKind.Video, SOURCE_ID, 0, limit))
+
+
+def msgpack_response(db, limit: int) -> bytes:
+    return encode_msgpack_columns(crud.get_inference_rows(db, schemas.SourceKind.Video, SOURCE_ID, 0, limit))
+
+
+def measure(db, respond, limit: int, n_runs: int) -> dict:
+    samples = []
+    for _ in range(n_runs):
+        t0 = time.perf_counter()
+        respond(db, limit)
+        samples.append(time.perf_counter() - t0)
+        db.expunge_all()
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark inferences endpoint serialization')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Rows per response')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='Keep seeded rows')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    args = parser.parse_args()
+
+    sizes = [int(it) for it in args.sizes.split(',')]
+    db = SessionLocal()
+    runs = []
+    try:
+        cleanup(db)
+        seed(db, max(sizes), time.time(), args.seed)
+        for size in sizes:
+            run = {
+                'rows': size,
+                'orm': measure(db, orm_response, size, args.runs),
+                'raw': measure(db, raw_response, size, args.runs),
+                'msgpack': measure(db, msgpack_response, size, args.runs),
+                'bytes_equal': orm_response(db, size) == raw_response(db, size),
+                'json_bytes': len(raw_response(db, size)),
+                'msgpack_bytes': len(msgpack_response(db, size)),
+            }
+            runs.append(run)
+            print(f"{size} rows: orm p50={run['orm']['p50']:.1f}ms raw p50={run['raw']['p50']:.1f}ms "
+                  f"x{run['orm']['p50'] / max(run['raw']['p50'], 1e-9):.1f} bytes_equal={run['bytes_equal']}, "
+                  f"msgpack p50={run['msgpack']['p50']:.1f}ms {run['msgpack_bytes']} vs {run['json_bytes']} bytes")
+    finally:
+        if not args.keep:
+            cleanup(db)
+        db.close()
+
+    result = {'meta': {'commit': git_commit(), 'dialect': db.get_bind().dialect.name, 'time': time.time()},
+              'runs': runs}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import threading
+from typing import Callable
+
+
+# @NOTE: Stop signal of a job, owned by the process. Runners register what stops them right away,
+#        instead of asking the database whether the source is still active.
+class CancelToken:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.callbacks: list[Callable[[], None]] = []
+
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+    # @NOTE: Callbacks run on the thread that cancels
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks = self.callbacks
+            self.callbacks = []
+        for callback in callbacks:
+            callback()
+
+    # @NOTE: Runs the callback at once when already cancelled
+    def on_cancel(self, callback: Callable[[], None]):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
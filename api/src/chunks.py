@@ -0,0 +1,279 @@
+import multiprocessing
+import time
+from collections import Counter
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from os import getenv
+from typing import Callable, NamedTuple
+
+import cv2
+from sqlalchemy.orm import Session
+
+from src import schemas
+from src.cancellation import CancelToken
+from src.metrics import SourceMetrics
+from src.pipeline import InferencePipeline, is_decoded_to_end, is_sampled, video_duration
+from src.writer import InferenceWriter, WRITER_COPY_BATCH_SIZE, coverage_gap
+
+VIDEO_WORKERS = int(getenv('VIDEO_WORKERS', '1'))
+CHUNK_MIN_SECONDS = 60.0
+CHUNK_OVERLAP = 2.0  # @NOTE: Seconds processed by both neighbouring chunks, to reconcile track ids
+CHUNK_MATCH_IOU = 0.5
+TRACK_ID_STRIDE = 1_000_000  # @NOTE: Keeps track ids of different chunks apart
+
+
+class ChunkResult(NamedTuple):
+    index: int
+    t_from: float
+    t_to: float
+    frames: list[tuple[float, list[schemas.InferenceHitCreate]]]  # @NOTE: (dpt, hits), including the overlap
+    # @NOTE: Metrics of the worker, prometheus_client of a spawned process is not exported, so they are recorded
+    #        by the parent: seconds per frame of each stage (grab, retrieve, pose, gun) and skipped frames by reason
+    seconds: dict[str, list[float]]
+    skipped: Counter
+    complete: bool  # @NOTE: Decoded up to t_to, or to the end of the stream, and not broken off before
+
+
+def split_chunks(t_duration: float, n_workers: int) -> list[tuple[float, float]]:
+    n_chunks = max(1, min(n_workers, int(t_duration // CHUNK_MIN_SECONDS)))
+    step = t_duration / n_chunks
+    # @NOTE: Last chunk is open-ended, because the container duration is not always exact
+    return [(i * step, (i + 1) * step if i < n_chunks - 1 else float('inf')) for i in range(n_chunks)]
+
+
+# @NOTE: Runs in a worker process
+def process_chunk(index: int, url: str, t_from: float, t_to: float, motion_threshold: float | None,
+                  analysis_fps: float | None, frame_step: int | None, track_id_offset: int = 0) -> ChunkResult:
+    from src.ml.guns import Runner
+    from src.ml.motion import MotionGate
+
+    runner = Runner()
+    gate = MotionGate(motion_threshold) if motion_threshold is not None else None
+    offset = track_id_offset + index * TRACK_ID_STRIDE
+
+    cap = cv2.VideoCapture(url)
+    t_duration = video_duration(cap)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    # @NOTE: First chunk has no overlap, it starts at 0 or at the resume position
+    t_seek = max(0.0, t_from - CHUNK_OVERLAP) if index > 0 else t_from
+    if t_seek > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, t_seek * 1000)
+
+    frames = []
+    seconds = {'grab': [], 'retrieve': [], 'pose': [], 'gun': []}
+    skipped = Counter()
+    hits = []
+    last_dpt = None
+    t_grabbed = None
+    complete = False
+    while True:
+        t0 = time.perf_counter()
+        ret = cap.grab()
+        if not ret:
+            complete = is_decoded_to_end(t_grabbed, t_duration, fps)
+            break
+        seconds['grab'].append(time.perf_counter() - t0)
+
+        dpt = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        t_grabbed = dpt
+        if dpt >= t_to:
+            complete = True
+            break
+        n_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+        if not is_sampled(n_frame, dpt, last_dpt, analysis_fps, frame_step):
+            skipped['sampling'] += 1
+            continue
+        last_dpt = dpt
+
+        t0 = time.perf_counter()
+        status, frame = cap.retrieve()
+        if not status:
+            continue
+        seconds['retrieve'].append(time.perf_counter() - t0)
+        if gate is None or not gate.is_static(frame):
+            hits = runner.infer(frame, dpt)
+            timings = runner.timings
+            seconds['pose'].append(timings.get('pose', 0.0))
+            seconds['gun'].append(timings.get('crop', 0.0) + timings.get('gun', 0.0) + timings.get('hits', 0.0))
+        else:
+            skipped['static'] += 1
+        frames.append((dpt, [schemas.InferenceHitCreate(**{**hit.dict(), 'track_id': hit.track_id + offset})
+                             for hit in hits]))
+    cap.release()
+
+    return ChunkResult(index, t_from, t_to, frames, seconds, skipped, complete)
+
+
+# @NOTE: Runs in a worker process, one per chunk. Sends the result or the exception back to the parent.
+def run_chunk_worker(conn: Connection, *args):
+    try:
+        result = process_chunk(*args)
+    except Exception as e:
+        conn.send(e)
+    else:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+def record_chunk_metrics(metrics: SourceMetrics, result: ChunkResult):
+    for name, histogram in (('grab', metrics.grab_seconds), ('retrieve', metrics.retrieve_seconds),
+                            ('pose', metrics.pose_seconds), ('gun', metrics.gun_seconds)):
+        for seconds in result.seconds[name]:
+            histogram.observe(seconds)
+    metrics.frames_skipped_static.inc(result.skipped['static'])
+    metrics.frames_skipped_sampling.inc(result.skipped['sampling'])
+
+
+def iou(a: schemas.InferenceHitCreate, b: schemas.InferenceHitCreate) -> float:
+    iw = min(a.x + a.w / 2, b.x + b.w / 2) - max(a.x - a.w / 2, b.x - b.w / 2)
+    ih = min(a.y + a.h / 2, b.y + b.h / 2) - max(a.y - a.h / 2, b.y - b.h / 2)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / (a.w * a.h + b.w * b.h - inter)
+
+
+# @NOTE: Matches hits of both chunks on the frames they both processed, and maps track ids of the next chunk
+#        onto track ids of the previous one by majority vote
+def reconcile_track_ids(prev: ChunkResult, cur: ChunkResult) -> dict[int, int]:
+    prev_frames = {round(dpt, 3): hits for dpt, hits in prev.frames if dpt >= cur.t_from - CHUNK_OVERLAP}
+
+    votes = Counter()
+    for dpt, hits in cur.frames:
+        if dpt >= cur.t_from:
+            break
+        prev_hits = prev_frames.get(round(dpt, 3))
+        if not prev_hits:
+            continue
+        for hit in hits:
+            best = max(prev_hits, key=lambda it: iou(hit, it))
+            if iou(hit, best) >= CHUNK_MATCH_IOU:
+                votes[(hit.track_id, best.track_id)] += 1
+
+    mapping: dict[int, int] = {}
+    taken = set()
+    for (cur_id, prev_id), _ in votes.most_common():
+        if cur_id in mapping or prev_id in taken:
+            continue
+        mapping[cur_id] = prev_id
+        taken.add(prev_id)
+    return mapping
+
+
+# @NOTE: Workers are killed instead of waiting for the chunks they are on, so that a stop takes effect at once
+def terminate_workers(processes: list[BaseProcess]):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def run_chunked(
+        db: Session,
+        url: str,
+        source_kind: schemas.SourceKind,
+        source_id: int,
+        t_base: float,
+        n_workers: int = VIDEO_WORKERS,
+        motion_threshold: float | None = None,
+        analysis_fps: float | None = None,
+        frame_step: int | None = None,
+        cancel: CancelToken | None = None,
+        on_progress: Callable[[float, float | None], None] | None = None,
+        t_resume: float = 0.0,
+        track_id_offset: int = 0,
+):
+    cap = cv2.VideoCapture(url)
+    t_duration = video_duration(cap)
+    cap.release()
+    if t_duration is None:
+        # @NOTE: Can not be split, e.g. a container without a frame count, so it is processed as a whole
+        print(f'Unknown duration of {source_kind.value} source {source_id}, processing without chunks')
+        pipeline = InferencePipeline(db, url, source_kind, source_id, t_base, motion_threshold=motion_threshold,
+                                     offline=True, analysis_fps=analysis_fps, frame_step=frame_step,
+                                     cancel=cancel, on_progress=on_progress,
+                                     t_resume=t_resume, track_id_offset=track_id_offset)
+        pipeline.run()
+        return
+
+    # @NOTE: Only what is left after the resume position is split
+    chunks = [(t_resume + t_from, t_resume + t_to) for t_from, t_to in split_chunks(t_duration - t_resume, n_workers)]
+    metrics = SourceMetrics(source_kind, source_id)
+    writer = InferenceWriter(db, batch_size=WRITER_COPY_BATCH_SIZE, use_copy=True, max_gap=coverage_gap(analysis_fps))
+
+    def flush():
+        t0 = time.perf_counter()
+        if len(writer.flush()) > 0:
+            metrics.db_write_seconds.observe(time.perf_counter() - t0)
+    # @NOTE: Spawn, because CUDA does not survive a fork. A process per chunk, managed here, so that a stop
+    #        can terminate them through the public API
+    context = multiprocessing.get_context('spawn')
+    processes: list[BaseProcess] = []
+    conns: list[Connection] = []
+    try:
+        for index, (t_from, t_to) in enumerate(chunks):
+            recv_conn, send_conn = context.Pipe(duplex=False)
+            process = context.Process(target=run_chunk_worker, name=f'chunk:{source_kind.value}:{source_id}:{index}',
+                                      args=(send_conn, index, url, t_from, t_to, motion_threshold, analysis_fps,
+                                            frame_step, track_id_offset),
+                                      daemon=True)
+            process.start()
+            send_conn.close()  # @NOTE: Only the worker holds it, so that recv sees EOF once the worker is gone
+            processes.append(process)
+            conns.append(recv_conn)
+
+        if cancel is not None:
+            cancel.on_cancel(lambda: terminate_workers(processes))
+
+        # @NOTE: Chunks are written in order, so that track ids can be reconciled against the previous chunk
+        prev: ChunkResult | None = None
+        for process, conn in zip(processes, conns):
+            try:
+                result: ChunkResult | Exception = conn.recv()
+            except EOFError:
+                if cancel is not None and cancel.is_cancelled():
+                    return
+                process.join()
+                raise RuntimeError(f'Chunk worker {process.name} exited with code {process.exitcode}')
+            if isinstance(result, Exception):
+                raise result
+            if cancel is not None and cancel.is_cancelled():
+                return
+            record_chunk_metrics(metrics, result)
+            mapping = reconcile_track_ids(prev, result) if prev is not None else {}
+            for dpt, hits in result.frames:
+                for hit in hits:
+                    hit.track_id = mapping.get(hit.track_id, hit.track_id)
+
+            for dpt, hits in result.frames:
+                if dpt < result.t_from:
+                    continue  # @NOTE: Overlap was already written by the previous chunk
+                if t_resume > 0 and dpt <= t_resume:
+                    continue  # @NOTE: Written before the resume, seeking lands on a keyframe before the position
+                inference = schemas.InferenceCreate(t=t_base + dpt, hits=hits, source_kind=source_kind,
+                                                    source_id=source_id)
+                writer.add(inference)
+                if writer.is_due():
+                    flush()
+                metrics.frames_processed.inc()
+                metrics.hits.observe(len(hits))
+            flush()
+
+            print(f'Processed chunk {result.index + 1}/{len(chunks)}')
+            is_last = result.index == len(chunks) - 1
+            if on_progress is not None:
+                # @NOTE: Progress is the resume position, so it is the last written frame, a frame right at
+                #        the end of the chunk belongs to the next one
+                t_last = max((dpt for dpt, _ in result.frames if dpt >= result.t_from), default=result.t_from)
+                on_progress(t_duration if is_last and result.complete else t_last, t_duration)
+            if not result.complete:
+                # @NOTE: Later chunks would leave a gap before them, the next run resumes from the last written frame
+                print(f'Chunk {result.index + 1}/{len(chunks)} broke off, stopping')
+                return
+            prev = result
+    finally:
+        terminate_workers(processes)
+        for process in processes:
+            process.join()
+        for conn in conns:
+            conn.close()
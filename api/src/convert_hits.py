@@ -0,0 +1,93 @@
+# @NOTE: Converts stored hits between the two storages of INFERENCE_STORAGE (see src/packing.py)
+#        python -m src.convert_hits --to packed
+#        Reads handle both storages at once, so it can run while the API is up. Each batch commits on its own,
+#        an interrupted run is finished by running it again.
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import numpy as np
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from src import packing
+from src.database import SessionLocal
+
+BATCH_SIZE = 10000
+
+
+def id_ranges(db: Session):
+    # @NOTE: In id ranges, so that a large history is not loaded at once
+    max_id = db.execute(text('SELECT max(id) FROM inferences')).scalar() or 0
+    for id_from in range(0, max_id + 1, BATCH_SIZE):
+        yield id_from, id_from + BATCH_SIZE
+
+
+def pack_batch(db: Session, id_from: int, id_to: int) -> int:
+    rows = db.execute(text('''
+        SELECT inference_id, x, y, w, h, c, track_id FROM inference_hits
+        WHERE inference_id >= :id_from AND inference_id < :id_to
+        ORDER BY inference_id, id
+    '''), dict(id_from=id_from, id_to=id_to)).all()
+    hits_by_inference = {}
+    for inference_id, x, y, w, h, c, track_id in rows:
+        hits_by_inference.setdefault(inference_id, []).append((x, y, w, h, c, -1 if track_id is None else track_id))
+    if len(hits_by_inference) == 0:
+        return 0
+    ids = dict(ids=list(hits_by_inference))
+    # @NOTE: Appended to what is already packed, a frame may have both
+    packed = dict(db.execute(text('SELECT id, hits_packed FROM inferences WHERE id IN :ids')
+                             .bindparams(bindparam('ids', expanding=True)), ids).all())
+    updates = []
+    for inference_id, hits in hits_by_inference.items():
+        hits_packed = bytes(packed.get(inference_id) or b'') + np.array(hits, dtype=packing.HIT_DTYPE).tobytes()
+        updates.append(dict(id=inference_id, hits_packed=hits_packed))
+    db.execute(text('UPDATE inferences SET hits_packed = :hits_packed WHERE id = :id'), updates)
+    db.execute(text('DELETE FROM inference_hits WHERE inference_id IN :ids')
+               .bindparams(bindparam('ids', expanding=True)), ids)
+    db.commit()
+    return len(rows)
+
+
+def unpack_batch(db: Session, id_from: int, id_to: int) -> int:
+    rows = db.execute(text('''
+        SELECT id, t, source_kind, hits_packed FROM inferences
+        WHERE id >= :id_from AND id < :id_to AND hits_packed IS NOT NULL
+    '''), dict(id_from=id_from, id_to=id_to)).all()
+    hit_rows = []
+    for inference_id, t, source_kind, hits_packed in rows:
+        for x, y, w, h, c, track_id in packing.unpack_array(hits_packed).tolist():
+            hit_rows.append(dict(x=x, y=y, w=w, h=h, c=c, track_id=None if track_id == -1 else track_id,
+                                 inference_id=inference_id, t=t, source_kind=source_kind))
+    if len(rows) == 0:
+        return 0
+    if len(hit_rows) > 0:
+        db.execute(text('INSERT INTO inference_hits (x, y, w, h, c, track_id, inference_id, t, source_kind) '
+                        'VALUES (:x, :y, :w, :h, :c, :track_id, :inference_id, :t, :source_kind)'), hit_rows)
+    db.execute(text('UPDATE inferences SET hits_packed = NULL WHERE id IN :ids')
+               .bindparams(bindparam('ids', expanding=True)), dict(ids=[row[0] for row in rows]))
+    db.commit()
+    return len(hit_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert stored inference hits between rows and packed storage')
+    parser.add_argument('--to', choices=['rows', 'packed'], default=packing.INFERENCE_STORAGE,
+                        help='Target storage, INFERENCE_STORAGE by default')
+    args = parser.parse_args()
+
+    convert_batch = pack_batch if args.to == 'packed' else unpack_batch
+    db = SessionLocal()
+    try:
+        n_converted = 0
+        for id_from, id_to in id_ranges(db):
+            n_converted += convert_batch(db, id_from, id_to)
+        print(f'Converted {n_converted} hits to {args.to}')
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
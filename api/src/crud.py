@@ -1,9 +1,11 @@
 import datetime
+import io
 import time
 
+from sqlalchemy import func, insert, text
 from sqlalchemy.orm import Session, joinedload
 
-from . import models, schemas
+from . import models, packing, schemas
 
 
 def create_file(db: Session, file: schemas.FileCreate, s3_bucket: str, s3_key: str):
@@ -59,15 +61,128 @@ def update_video_source(db: Session, source_id: int, source: schemas.VideoSource
     return db_source
 
 
+def update_video_source_progress(db: Session, source_id: int, t_processed: float, t_duration: float | None):
+    db.query(models.VideoSource).filter_by(id=source_id).update({
+        models.VideoSource.t_processed: t_processed,
+        models.VideoSource.t_duration: t_duration,
+    })
+    db.commit()
+    return True
+
+
+# @NOTE: Progress is the checkpoint, inferences up to t_processed are committed with these params
+def start_video_source_inferences(db: Session, source_id: int, inference_params: str):
+    db.query(models.VideoSource).filter_by(id=source_id).update({
+        models.VideoSource.t_processed: 0,
+        models.VideoSource.t_duration: None,
+        models.VideoSource.inference_params: inference_params,
+        models.VideoSource.n_resumes: 0,
+    })
+    db.commit()
+    return True
+
+
+def resume_video_source_inferences(db: Session, source_id: int) -> int:
+    db_source = db.get(models.VideoSource, source_id)
+    db_source.n_resumes = (db_source.n_resumes or 0) + 1
+    db.commit()
+    return db_source.n_resumes
+
+
+# @PERF: Only hides current inferences of the source, rows are deleted in background by src.retention,
+#        so that a new inference task does not wait for a large delete
 def destroy_inferences(db: Session, source_kind: schemas.SourceKind, source_id: int):
-    db_inferences_query = db.query(models.Inference).filter_by(source_kind=source_kind, source_id=source_id)
-    db_inference_ids_query = db_inferences_query.with_entities(models.Inference.id)
-    db_hits_query = db.query(models.InferenceHit).filter(models.InferenceHit.inference_id.in_(db_inference_ids_query.subquery()))
-    db_hits_query.delete()
-    db_inferences_query.delete()
+    db_wipe = models.InferenceWipe()
+    db_wipe.source_kind = source_kind
+    db_wipe.source_id = source_id
+    db_wipe.inference_id_to = db.query(func.max(models.Inference.id)).scalar() or 0
+    db_wipe.coverage_id_to = db.query(func.max(models.InferenceCoverage.id)).scalar() or 0
+    db_wipe.created_at = datetime.datetime.now()
+    db.add(db_wipe)
     db.commit()
     return True
 
+
+def get_inference_wipes(db: Session):
+    return db.query(models.InferenceWipe).order_by(models.InferenceWipe.id).all()
+
+
+# @NOTE: Deletes up to batch_size inferences of a wipe, returns how many were deleted
+def wipe_inferences_batch(db: Session, db_wipe: models.InferenceWipe, batch_size: int) -> int:
+    q = db.query(models.Inference.id)
+    q = q.filter_by(source_kind=db_wipe.source_kind, source_id=db_wipe.source_id)
+    q = q.filter(models.Inference.id <= db_wipe.inference_id_to)
+    ids = [it for it, in q.limit(batch_size).all()]
+    if len(ids) > 0:
+        # @NOTE: source_kind lets PostgreSQL skip partitions of other kinds
+        db.query(models.InferenceHit) \
+            .filter(models.InferenceHit.source_kind == db_wipe.source_kind, models.InferenceHit.inference_id.in_(ids)) \
+            .delete(synchronize_session=False)
+        db.query(models.Inference) \
+            .filter(models.Inference.source_kind == db_wipe.source_kind, models.Inference.id.in_(ids)) \
+            .delete(synchronize_session=False)
+    else:
+        db.query(models.InferenceCoverage) \
+            .filter_by(source_kind=db_wipe.source_kind, source_id=db_wipe.source_id) \
+            .filter(models.InferenceCoverage.id <= db_wipe.coverage_id_to) \
+            .delete(synchronize_session=False)
+        db.delete(db_wipe)
+    db.commit()
+    return len(ids)
+
+
+# @NOTE: Retention without partitions, deletes up to batch_size inferences older than t_before
+def expire_inferences_batch(db: Session, source_kind: schemas.SourceKind, t_before: float, batch_size: int) -> int:
+    q = db.query(models.Inference.id)
+    q = q.filter(models.Inference.source_kind == source_kind, models.Inference.t < t_before)
+    ids = [it for it, in q.limit(batch_size).all()]
+    if len(ids) > 0:
+        db.query(models.InferenceHit) \
+            .filter(models.InferenceHit.source_kind == source_kind, models.InferenceHit.inference_id.in_(ids)) \
+            .delete(synchronize_session=False)
+        db.query(models.Inference) \
+            .filter(models.Inference.source_kind == source_kind, models.Inference.id.in_(ids)) \
+            .delete(synchronize_session=False)
+    db.commit()
+    return len(ids)
+
+
+def expire_inference_coverages(db: Session, source_kind: schemas.SourceKind, t_before: float):
+    db.query(models.InferenceCoverage) \
+        .filter(models.InferenceCoverage.source_kind == source_kind, models.InferenceCoverage.t_to < t_before) \
+        .delete(synchronize_session=False)
+    db.commit()
+    return True
+
+
+# @NOTE: Drops what was written after a checkpoint, e.g. a flush that was committed right before a crash,
+#        but whose progress was not. Only a batch or so, so it is deleted at once instead of through a wipe.
+def truncate_inferences(db: Session, source_kind: schemas.SourceKind, source_id: int, t_after: float):
+    ids = [it for it, in db.query(models.Inference.id).filter(
+        models.Inference.source_kind == source_kind, models.Inference.source_id == source_id,
+        models.Inference.t > t_after).all()]
+    if len(ids) > 0:
+        db.query(models.InferenceHit) \
+            .filter(models.InferenceHit.source_kind == source_kind, models.InferenceHit.inference_id.in_(ids)) \
+            .delete(synchronize_session=False)
+        db.query(models.Inference) \
+            .filter(models.Inference.source_kind == source_kind, models.Inference.id.in_(ids)) \
+            .delete(synchronize_session=False)
+    q = db.query(models.InferenceCoverage).filter_by(source_kind=source_kind, source_id=source_id)
+    q.filter(models.InferenceCoverage.t_from > t_after).delete(synchronize_session=False)
+    q.filter(models.InferenceCoverage.t_to > t_after).update({models.InferenceCoverage.t_to: t_after},
+                                                             synchronize_session=False)
+    db.commit()
+    return len(ids)
+
+
+def get_wiped_ids(db: Session, source_kind: schemas.SourceKind, source_id: int) -> tuple[int, int]:
+    # @NOTE: Rows up to these ids belong to a previous run of the source and are being deleted
+    q = db.query(func.max(models.InferenceWipe.inference_id_to), func.max(models.InferenceWipe.coverage_id_to))
+    inference_id_to, coverage_id_to = q.filter_by(source_kind=source_kind, source_id=source_id).one()
+    return inference_id_to or 0, coverage_id_to or 0
+
+
 def create_inference(db: Session, inference: schemas.InferenceCreate):
     db_inference = models.Inference()
 
@@ -76,13 +191,18 @@ def create_inference(db: Session, inference: schemas.InferenceCreate):
     for var, value in attrs.items():
         setattr(db_inference, var, value)
 
-    for hit in inference.hits:
-        db_hit = models.InferenceHit()
-        attrs = hit.dict(exclude_unset=True)
-        for var, value in attrs.items():
-            setattr(db_hit, var, value)
+    if packing.is_packed():
+        db_inference.hits_packed = packing.pack_hits(inference.hits)
+    else:
+        for hit in inference.hits:
+            db_hit = models.InferenceHit()
+            attrs = hit.dict(exclude_unset=True)
+            for var, value in attrs.items():
+                setattr(db_hit, var, value)
+            db_hit.t = inference.t
+            db_hit.source_kind = inference.source_kind
 
-        db_inference.hits.append(db_hit)
+            db_inference.hits.append(db_hit)
 
     db.add(db_inference)
     db.commit()
@@ -90,29 +210,101 @@ def create_inference(db: Session, inference: schemas.InferenceCreate):
     return db_inference
 
 
-def create_inferences(db: Session, inferences: list[schemas.InferenceCreate]):
-    db_inferences = []
-    for inference in inferences:
-        db_inference = models.Inference()
+def create_inferences(db: Session, inferences: list[schemas.InferenceCreate]) -> list[dict]:
+    if len(inferences) == 0:
+        return []
 
-        attrs = inference.dict(exclude_unset=True)
-        del attrs['hits']
-        for var, value in attrs.items():
-            setattr(db_inference, var, value)
+    # @PERF: One multi-row insert for parents and one for hits, instead of ORM objects per row
+    packed = packing.is_packed()
+    rows = [dict(t=inference.t, source_kind=inference.source_kind, source_id=inference.source_id,
+                 hits_packed=packing.pack_hits(inference.hits) if packed else None)
+            for inference in inferences]
+    stmt = insert(models.Inference).returning(models.Inference.id, sort_by_parameter_order=True)
+    ids = db.scalars(stmt, rows).all()
+    if packed:
+        db.commit()
+        return written_rows(inferences, ids, [row['hits_packed'] for row in rows], None)
 
+    hit_rows = []
+    for inference_id, inference in zip(ids, inferences):
         for hit in inference.hits:
-            db_hit = models.InferenceHit()
-            attrs = hit.dict(exclude_unset=True)
-            for var, value in attrs.items():
-                setattr(db_hit, var, value)
-
-            db_inference.hits.append(db_hit)
+            hit_rows.append(dict(hit.dict(exclude_unset=True), inference_id=inference_id, t=inference.t,
+                                 source_kind=inference.source_kind))
+    hit_ids = []
+    if len(hit_rows) > 0:
+        stmt = insert(models.InferenceHit).returning(models.InferenceHit.id, sort_by_parameter_order=True)
+        hit_ids = db.scalars(stmt, hit_rows).all()
 
-        db_inferences.append(db_inference)
+    db.commit()
+    return written_rows(inferences, ids, None, hit_ids)
+
+
+# @NOTE: Written inferences in the shape of get_inference_rows, so that recent ones are served without a read
+def written_rows(inferences: list[schemas.InferenceCreate], ids: list[int], hits_packed: list[bytes] | None,
+                 hit_ids: list[int] | None) -> list[dict]:
+    rows = []
+    hit_ids = iter(hit_ids or [])
+    for i, (inference_id, inference) in enumerate(zip(ids, inferences)):
+        if hits_packed is not None:
+            # @NOTE: From the packed bytes, float32 values are what reads return
+            hits = packing.unpack_hit_rows(inference_id, hits_packed[i])
+        else:
+            hits = [{'x': hit.x, 'y': hit.y, 'w': hit.w, 'h': hit.h, 'c': hit.c, 'track_id': hit.track_id,
+                     'id': next(hit_ids)} for hit in inference.hits]
+        rows.append({'t': inference.t, 'hits': hits, 'id': inference_id})
+    return rows
+
+
+def copy_value(value) -> str:
+    # @NOTE: NULL in COPY text format
+    return '\\N' if value is None else repr(value)
+
+
+def allocate_ids(db: Session, sequence: str, n: int) -> list[int]:
+    if n == 0:
+        return []
+    return db.scalars(text(f"SELECT nextval('{sequence}') FROM generate_series(1, :n)"), {'n': n}).all()
+
+
+def copy_inferences(db: Session, inferences: list[schemas.InferenceCreate]) -> list[dict]:
+    if len(inferences) == 0:
+        return []
+
+    # @NOTE: No COPY outside of PostgreSQL (e.g. SQLite for local development)
+    if db.get_bind().dialect.name != 'postgresql':
+        return create_inferences(db, inferences)
+
+    # @PERF: Ids are allocated up front, so that hits can reference their inference without a round trip per row
+    packed = packing.is_packed()
+    ids = allocate_ids(db, 'inferences_id_seq', len(inferences))
+    hit_ids = None if packed else allocate_ids(db, 'inference_hits_id_seq', sum(len(it.hits) for it in inferences))
+    hits_packed = [packing.pack_hits(inference.hits) for inference in inferences] if packed else None
+
+    inferences_buffer = io.StringIO()
+    hits_buffer = io.StringIO()
+    hit_ids_iter = iter(hit_ids or [])
+    for i, (inference_id, inference) in enumerate(zip(ids, inferences)):
+        # @NOTE: bytea in COPY text format is \\x followed by hex
+        hits_packed_value = '\\\\x' + hits_packed[i].hex() if packed else '\\N'
+        inferences_buffer.write(f'{inference_id}\t{inference.t!r}\t{inference.source_kind.name}\t{inference.source_id}'
+                                f'\t{hits_packed_value}\n')
+        if packed:
+            continue
+        for hit in inference.hits:
+            hits_buffer.write(f'{next(hit_ids_iter)}\t')
+            hits_buffer.write('\t'.join(copy_value(it) for it in (hit.x, hit.y, hit.w, hit.h, hit.c, hit.track_id)))
+            hits_buffer.write(f'\t{inference_id}\t{inference.t!r}\t{inference.source_kind.name}\n')
+    inferences_buffer.seek(0)
+    hits_buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert('COPY inferences (id, t, source_kind, source_id, hits_packed) FROM STDIN', inferences_buffer)
+    cursor.copy_expert('COPY inference_hits (id, x, y, w, h, c, track_id, inference_id, t, source_kind) FROM STDIN',
+                       hits_buffer)
+    cursor.close()
 
-    db.bulk_save_objects(db_inferences)
     db.commit()
-    return True
+    return written_rows(inferences, ids, hits_packed, hit_ids)
 
 
 def destroy_video_source(db: Session, source_id: int):
@@ -176,10 +368,140 @@ def destroy_camera_source(db: Session, source_id: int):
 
     return True
 
+# @NOTE: Does not commit, so that coverage is committed together with the inferences it covers
+def save_inference_coverage(db: Session, source_kind: schemas.SourceKind, source_id: int, coverage_id: int | None,
+                            t_from: float, t_to: float) -> int:
+    if coverage_id is None:
+        stmt = insert(models.InferenceCoverage).returning(models.InferenceCoverage.id)
+        return db.scalar(stmt, dict(source_kind=source_kind, source_id=source_id, t_from=t_from, t_to=t_to))
+    db.query(models.InferenceCoverage).filter_by(id=coverage_id).update({models.InferenceCoverage.t_to: t_to})
+    return coverage_id
+
+
+def get_inference_coverages(db: Session, source_kind: schemas.SourceKind, source_id: int, since_t: float):
+    _, coverage_id_to = get_wiped_ids(db, source_kind, source_id)
+    q = db.query(models.InferenceCoverage)
+    q = q.filter_by(source_kind=source_kind, source_id=source_id)
+    q = q.filter(models.InferenceCoverage.id > coverage_id_to)
+    q = q.filter(models.InferenceCoverage.t_to > since_t)
+    q = q.order_by(models.InferenceCoverage.t_from)
+    return q.all()
+
+
 def get_inferences(db: Session, source_kind: schemas.SourceKind, source_id: int, since_t: float, limit: int):
+    inference_id_to, _ = get_wiped_ids(db, source_kind, source_id)
     q = db.query(models.Inference).options(joinedload(models.Inference.hits))
     q = q.filter_by(source_kind=source_kind, source_id=source_id)
+    q = q.filter(models.Inference.id > inference_id_to)
     q = q.filter(models.Inference.t > since_t)
     q = q.order_by(models.Inference.t)
     db_inferences = q.limit(limit).all()
-    return db_inferences
\ No newline at end of file
+    return expand_inferences(db_inferences)
+
+
+# @NOTE: Also explained by bench.query_plan
+INFERENCE_ROWS_QUERY = text('''
+    SELECT i.id, i.t, i.hits_packed, h.id, h.x, h.y, h.w, h.h, h.c, h.track_id
+    FROM (
+        SELECT id, t, hits_packed FROM inferences
+        WHERE source_kind = :source_kind AND source_id = :source_id AND id > :inference_id_to AND t > :since_t
+        ORDER BY t
+        LIMIT :limit
+    ) i
+    LEFT JOIN inference_hits h ON h.inference_id = i.id AND h.t = i.t AND h.source_kind = :source_kind
+    ORDER BY i.t, i.id, h.id
+''')
+
+
+# @PERF: Same result as get_inferences, but from one raw query grouped in one pass into plain dicts,
+#        no ORM objects and no Pydantic validation. Key order follows schemas.Inference.
+def get_inference_rows(db: Session, source_kind: schemas.SourceKind, source_id: int, since_t: float,
+                       limit: int) -> list[dict]:
+    inference_id_to, _ = get_wiped_ids(db, source_kind, source_id)
+    result = db.execute(INFERENCE_ROWS_QUERY, dict(source_kind=source_kind.name, source_id=source_id,
+                                                   inference_id_to=inference_id_to, since_t=since_t, limit=limit))
+
+    rows = []
+    row = None
+    for inference_id, t, hits_packed, hit_id, x, y, w, h, c, track_id in result:
+        if row is None or row['id'] != inference_id:
+            row = {'t': t, 'hits': [], 'id': inference_id}
+            rows.append(row)
+            if hits_packed is not None:
+                row['hits'].extend(packing.unpack_hit_rows(inference_id, hits_packed))
+        if hit_id is not None:
+            row['hits'].append({'x': x, 'y': y, 'w': w, 'h': h, 'c': c, 'track_id': track_id, 'id': hit_id})
+    return rows
+
+
+def expand_inferences(db_inferences: list[models.Inference]) -> list[models.Inference | schemas.Inference]:
+    # @NOTE: Packed hits are expanded to the same shape as hits stored as rows
+    result = []
+    for db_inference in db_inferences:
+        if db_inference.hits_packed is None:
+            result.append(db_inference)
+        else:
+            hits = db_inference.hits + packing.unpack_hits(db_inference.id, db_inference.hits_packed)
+            result.append(schemas.Inference(id=db_inference.id, t=db_inference.t, hits=hits))
+    return result
+
+
+# @PERF: Aggregated in SQL, so that a timeline of a long video is one small response instead of all inferences
+def get_timeline(db: Session, source_kind: schemas.SourceKind, source_id: int, t_from: float, t_to: float,
+                 bucket: float, min_c: float) -> list[schemas.TimelineBucket]:
+    inference_id_to, _ = get_wiped_ids(db, source_kind, source_id)
+    buckets: dict[int, schemas.TimelineBucket] = {}
+
+    def get_bucket(index: int) -> schemas.TimelineBucket:
+        if index not in buckets:
+            t = t_from + index * bucket
+            buckets[index] = schemas.TimelineBucket(t_from=t, t_to=t + bucket, n_inferences=0, n_hits=0, max_c=None,
+                                                    track_ids=[])
+        return buckets[index]
+
+    inference_filters = [
+        models.Inference.source_kind == source_kind,
+        models.Inference.source_id == source_id,
+        models.Inference.id > inference_id_to,
+        models.Inference.t >= t_from,
+        models.Inference.t < t_to,
+    ]
+
+    index = func.floor((models.Inference.t - t_from) / bucket).label('index')
+    q = db.query(index, func.count()).filter(*inference_filters).group_by(index)
+    for i, n_inferences in q.all():
+        get_bucket(int(i)).n_inferences = n_inferences
+
+    # @NOTE: Per track, so that distinct track ids of a bucket come out as a list
+    index = func.floor((models.InferenceHit.t - t_from) / bucket).label('index')
+    q = db.query(index, models.InferenceHit.track_id, func.max(models.InferenceHit.c), func.count())
+    q = q.join(models.InferenceHit.inference)
+    q = q.filter(*inference_filters)
+    # @NOTE: Same conditions on hits, so that PostgreSQL prunes hit partitions too
+    q = q.filter(models.InferenceHit.source_kind == source_kind, models.InferenceHit.t >= t_from,
+                 models.InferenceHit.t < t_to, models.InferenceHit.c >= min_c)
+    q = q.group_by(index, models.InferenceHit.track_id)
+    hits_by_bucket: dict[int, list[tuple[int | None, float, int]]] = {}
+    for i, track_id, max_c, n_hits in q.all():
+        hits_by_bucket.setdefault(int(i), []).append((track_id, max_c, n_hits))
+
+    # @NOTE: Packed hits can only be aggregated here
+    q = db.query(models.Inference.t, models.Inference.hits_packed)
+    q = q.filter(*inference_filters, models.Inference.hits_packed != None)
+    for t, hits_packed in q.all():
+        packed = packing.unpack_array(hits_packed)
+        packed = packed[packed['c'] >= min_c]
+        for track_id in set(packed['track_id'].tolist()):
+            of_track = packed[packed['track_id'] == track_id]
+            hits_by_bucket.setdefault(int((t - t_from) // bucket), []).append(
+                (None if track_id == -1 else track_id, float(of_track['c'].max()), len(of_track)))
+
+    for i, hits in hits_by_bucket.items():
+        item = get_bucket(i)
+        for track_id, max_c, n_hits in hits:
+            item.n_hits += n_hits
+            item.max_c = max_c if item.max_c is None else max(item.max_c, max_c)
+            if track_id is not None and track_id not in item.track_ids:
+                item.track_ids.append(track_id)
+
+    return [buckets[i] for i in sorted(buckets)]
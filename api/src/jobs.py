@@ -0,0 +1,179 @@
+import threading
+import time
+import traceback
+from collections import deque
+from os import getenv
+from typing import Callable
+
+from src import schemas
+from src.cancellation import CancelToken
+from src.recent import recent
+
+# @NOTE: In inference workers, a video takes one, a chunked video takes VIDEO_WORKERS.
+#        Jobs over the budget wait in a queue, a job larger than the whole budget runs alone.
+JOB_COMPUTE_BUDGET = float(getenv('JOB_COMPUTE_BUDGET', '4'))
+# @NOTE: Cameras are live and never finish, so they cannot wait for the budget: they start at once,
+#        up to JOB_CAMERA_LIMIT running cameras (0 for no limit), and the budget is left to the jobs that finish
+JOB_CAMERA_LIMIT = int(getenv('JOB_CAMERA_LIMIT', '0'))
+# @NOTE: Seconds a queued job that does not fit lets later jobs that fit pass it,
+#        after that it holds them back until it starts, so that large jobs are not starved by small ones
+JOB_QUEUE_PATIENCE = float(getenv('JOB_QUEUE_PATIENCE', '60'))
+# @NOTE: Seconds the API waits on shutdown for stopped jobs to write what they have and their checkpoint
+JOB_SHUTDOWN_TIMEOUT = float(getenv('JOB_SHUTDOWN_TIMEOUT', '30'))
+JOB_HISTORY_SIZE = 100  # @NOTE: Finished jobs kept for the API, older ones are forgotten
+
+
+class Job:
+    def __init__(self, source_kind: schemas.SourceKind, source_id: int, cost: float,
+                 target: Callable[['Job'], None]):
+        self.source_kind = source_kind
+        self.source_id = source_id
+        self.cost = cost
+        self.target = target
+        self.state = schemas.JobState.Queued
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.error: str | None = None
+        self.cancel = CancelToken()
+        self.thread: threading.Thread | None = None
+
+    @property
+    def key(self) -> tuple[schemas.SourceKind, int]:
+        return self.source_kind, self.source_id
+
+    @property
+    def is_live(self) -> bool:
+        return self.source_kind == schemas.SourceKind.Camera
+
+    def is_stopping(self) -> bool:
+        return self.cancel.is_cancelled()
+
+
+# @NOTE: One job per source. Submitting again replaces the job of the source: a queued one is dropped,
+#        a running one is asked to stop and the new one starts only after it did, so that two runners
+#        never write inferences of the same source.
+class JobManager:
+    def __init__(self, budget: float = JOB_COMPUTE_BUDGET, camera_limit: int = JOB_CAMERA_LIMIT):
+        self.budget = budget
+        self.camera_limit = camera_limit
+        self.lock = threading.Lock()
+        self.jobs: dict[tuple[schemas.SourceKind, int], Job] = {}  # @NOTE: Latest job of each source
+        self.queue: deque[Job] = deque()
+        self.running: dict[tuple[schemas.SourceKind, int], Job] = {}
+        self.stopped = False
+
+    def running_cost(self) -> float:
+        return sum(it.cost for it in self.running.values() if not it.is_live)
+
+    def running_live(self) -> int:
+        return sum(1 for it in self.running.values() if it.is_live)
+
+    def submit(self, source_kind: schemas.SourceKind, source_id: int, cost: float,
+               target: Callable[[Job], None]) -> Job:
+        job = Job(source_kind, source_id, cost, target)
+        with self.lock:
+            self.cancel(job.key)
+            self.jobs[job.key] = job
+            self.queue.append(job)
+            self.schedule()
+        return job
+
+    def stop(self, source_kind: schemas.SourceKind, source_id: int):
+        with self.lock:
+            self.cancel((source_kind, source_id))
+            self.schedule()
+
+    def shutdown(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        with self.lock:
+            self.stopped = True
+            for key in list(self.jobs.keys()):
+                self.cancel(key)
+            threads = [job.thread for job in self.running.values()]
+        # @NOTE: Threads are daemons, so that a job which does not stop in time does not hold up the exit
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        n_alive = sum(1 for thread in threads if thread.is_alive())
+        if n_alive > 0:
+            print(f'{n_alive} jobs did not stop within {timeout:g}s')
+
+    def get(self, source_kind: schemas.SourceKind, source_id: int) -> Job | None:
+        with self.lock:
+            return self.jobs.get((source_kind, source_id))
+
+    def get_all(self) -> list[Job]:
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda it: it.created_at)
+
+    # @NOTE: Under the lock
+    def cancel(self, key: tuple[schemas.SourceKind, int]):
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        if job.state == schemas.JobState.Queued:
+            self.queue.remove(job)
+            job.state = schemas.JobState.Cancelled
+            job.finished_at = time.time()
+        elif job.state == schemas.JobState.Running:
+            job.state = schemas.JobState.Stopping
+            job.cancel.cancel()
+
+    # @NOTE: Under the lock. First come first served, jobs that fit pass one that does not for JOB_QUEUE_PATIENCE.
+    def schedule(self):
+        if self.stopped:
+            return
+        now = time.time()
+        blocked = False
+        for job in list(self.queue):
+            if job.key in self.running:
+                continue  # @NOTE: Previous job of the source is still stopping, does not hold back others
+            if job.is_live:
+                if 0 < self.camera_limit <= self.running_live():
+                    continue
+            elif blocked:
+                continue
+            elif self.running_cost() > 0 and self.running_cost() + job.cost > self.budget:
+                blocked = now - job.created_at > JOB_QUEUE_PATIENCE
+                continue
+            self.queue.remove(job)
+            self.running[job.key] = job
+            job.state = schemas.JobState.Running
+            job.started_at = time.time()
+            job.thread = threading.Thread(target=self.run, args=(job,), daemon=True,
+                                          name=f'job-{job.source_kind.value}-{job.source_id}')
+            job.thread.start()
+
+    def run(self, job: Job):
+        state = schemas.JobState.Done
+        error = None
+        try:
+            job.target(job)
+        except Exception as e:
+            traceback.print_exc()
+            state = schemas.JobState.Failed
+            error = str(e)
+        # @NOTE: Nobody in this process writes the source anymore, so the buffer is not kept complete.
+        #        The next job of the source starts only after this, and fills it again.
+        recent.clear(job.source_kind, job.source_id)
+        with self.lock:
+            del self.running[job.key]
+            if job.is_stopping() and state == schemas.JobState.Done:
+                state = schemas.JobState.Cancelled
+            job.state = state
+            job.error = error
+            job.finished_at = time.time()
+            self.forget_finished()
+            self.schedule()
+
+    # @NOTE: Under the lock
+    def forget_finished(self):
+        finished = [it for it in self.jobs.values() if it.finished_at is not None]
+        if len(finished) <= JOB_HISTORY_SIZE:
+            return
+        finished.sort(key=lambda it: it.finished_at)
+        for job in finished[:len(finished) - JOB_HISTORY_SIZE]:
+            del self.jobs[job.key]
+
+
+jobs = JobManager()
@@ -1,28 +1,40 @@
 import asyncio
+import json
 import time
 
 import cv2
 import httpx
 from botocore.client import BaseClient
 from dotenv import load_dotenv
-from starlette.responses import JSONResponse
-
-from src.ml.guns import Runner
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
+# @NOTE: Before src imports, modules read their env at import time
 load_dotenv()
 
+from src.ml.guns import model_version, warm_up
+from src.chunks import TRACK_ID_STRIDE, VIDEO_WORKERS, run_chunked
+from src.pipeline import InferencePipeline
+from src.retention import cleaner
+from src.encoding import inferences_response
+from src.pubsub import inference_events
+from src.recent import get_inference_rows, recent
+from src.jobs import Job, jobs
+from src.signals import listener, notify_source_change
+
 from os import getenv
 
 import uuid
 from contextlib import asynccontextmanager
+from functools import partial
 
 import botocore
-from fastapi import FastAPI, APIRouter, BackgroundTasks
+from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 import boto3
 from pydantic import BaseModel, Field
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from sqlalchemy.orm import Session
 
 from src import crud, models, schemas
@@ -31,7 +43,20 @@ from src.database import SessionLocal, engine
 # @NOTE: Use migrations instead
 # models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # @NOTE: Load and warm up models once per process, instead of on every inference task start
+    await asyncio.to_thread(warm_up)
+    cleaner.start()
+    listener.start()
+    yield
+    listener.stop()
+    await asyncio.to_thread(jobs.shutdown)
+    cleaner.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 def get_db():
@@ -85,6 +110,16 @@ app.add_middleware(
 )
 
 
+@app.get('/v1/jobs')
+def read_jobs() -> list[schemas.Job]:
+    return jobs.get_all()
+
+
+@app.get('/metrics')
+def get_metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post('/v1/files')
 def upload_file(
         file: schemas.FileCreate,
@@ -110,154 +145,126 @@ def read_video_sources(db: Session = Depends(get_db)) -> list[schemas.VideoSourc
     return db_sources
 
 
-async def infer_video_source_task(
-        source_id: int,
-        db: Session,
-        s3_client: BaseClient,
-):
-    db_source = crud.get_video_source(db, source_id)
-    if db_source is None:
-        return
-
-    if not db_source.is_active:
-        return
-
-    db_file: models.File = db_source.file
-    url = s3_client.generate_presigned_url(
-        'get_object',
-        Params={
-            'Bucket': db_file.s3_bucket,
-            'Key': db_file.s3_key,
-        },
-        ExpiresIn=3600)
-
-    def run():
-        runner = Runner()
-        cap = cv2.VideoCapture(url)
-        n_frames = 0
-        # start_time = time.time()
-        crud.destroy_inferences(db, schemas.SourceKind.Video, db_source.id)
-
-        rt_start = time.time()
-
-        # inference_buffer = []
-        # def push_inferences() -> bool:
-        #     crud.create_inferences(db, inference_buffer)
-        #     inference_buffer.clear()
-        #     db.refresh(db_source)
-        #     return db_source.is_active
-
-        while True:
-            ret = cap.grab()
-            if not ret:
-                break
-
-            dpt = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
-            drt = time.time() - rt_start
-
-            # @NOTE: Skip frames if we are behind realtime
-            if dpt / drt < 1:
-                continue
-
-            pt = db_source.t_start + dpt
-
-            status, frame = cap.retrieve()
-
-            hits = runner.infer(frame, dpt)
-            inference = schemas.InferenceCreate(t=pt, hits=hits, source_kind=schemas.SourceKind.Video,
-                                                source_id=db_source.id)
-            # inference_buffer.append(inference)
-            crud.create_inference(db, inference)
-
-            n_frames += 1
-            if n_frames % 100 == 0:
-                print(f'Processed {n_frames} frames')
-
-            if n_frames % 25 == 0:
-                db.refresh(db_source)
-                if not db_source.is_active:
-                    break
-        cap.release()
-        # push_inferences()
-
-    await asyncio.to_thread(run)
-
-
-async def infer_camera_source_task(
-        source_id: int,
-        db: Session,
-        s3_client: BaseClient,
-):
-    db_source = crud.get_camera_source(db, source_id)
-    if db_source is None:
-        return
-
-    if not db_source.is_active:
-        return
-
-    url = db_source.private_url
-
-    def run():
-        runner = Runner()
-        cap = cv2.VideoCapture(url)
-        n_frames = 0
-        # start_time = time.time()
-        crud.destroy_inferences(db, schemas.SourceKind.Video, db_source.id)
-
-        rt_start = time.time()
-
-        # inference_buffer = []
-        # def push_inferences() -> bool:
-        #     crud.create_inferences(db, inference_buffer)
-        #     inference_buffer.clear()
-        #     db.refresh(db_source)
-        #     return db_source.is_active
-
-        while True:
-            ret = cap.grab()
-            if not ret:
-                break
-
-            dpt = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
-            drt = time.time() - rt_start
-
-            # @NOTE: Skip frames if we are behind realtime
-            if dpt / drt < 1:
-                continue
-
-            pt = rt_start + dpt
-
-            status, frame = cap.retrieve()
-
-            hits = runner.infer(frame, dpt)
-            inference = schemas.InferenceCreate(t=pt, hits=hits, source_kind=schemas.SourceKind.Camera,
-                                                source_id=db_source.id)
-            # inference_buffer.append(inference)
-            crud.create_inference(db, inference)
-
-            n_frames += 1
-            if n_frames % 100 == 0:
-                print(f'Processed {n_frames} frames')
-
-            if n_frames % 25 == 0:
-                db.refresh(db_source)
-                if not db_source.is_active:
-                    break
-        cap.release()
-        # push_inferences()
-
-    await asyncio.to_thread(run)
+# @NOTE: Track ids of a resumed run are offset past the chunks of a run, wrapping around to stay within int32
+RESUME_TRACK_ID_STRIDE = 100 * TRACK_ID_STRIDE
+RESUME_TRACK_ID_CYCLE = 20
+
+
+# @NOTE: Everything that changes the results of a video, processing only resumes while it is the same
+def video_inference_params(db_source: models.VideoSource) -> str:
+    return json.dumps(dict(model=model_version(), motion_threshold=db_source.motion_threshold,
+                           is_offline=bool(db_source.is_offline), analysis_fps=db_source.analysis_fps,
+                           frame_step=db_source.frame_step), sort_keys=True)
+
+
+def infer_video_source_task(job: Job, source_id: int, s3_client: BaseClient, full: bool = False):
+    # @NOTE: Own session, a job outlives the request that submitted it
+    with SessionLocal() as db:
+        db_source = crud.get_video_source(db, source_id)
+        if db_source is None:
+            return
+
+        if not db_source.is_active:
+            return
+
+        db_file: models.File = db_source.file
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': db_file.s3_bucket,
+                'Key': db_file.s3_key,
+            },
+            ExpiresIn=3600)
+
+        def on_progress(t_processed: float, t_duration: float | None):
+            crud.update_video_source_progress(db, db_source.id, t_processed, t_duration)
+
+        # @PERF: Same models and params as the stored inferences, so processing goes on from the checkpoint
+        #        instead of starting over, e.g. after a restart of the API or a toggle of is_active
+        inference_params = video_inference_params(db_source)
+        t_resume = 0.0
+        track_id_offset = 0
+        if not full and db_source.inference_params == inference_params and db_source.t_processed:
+            if db_source.t_duration is not None and db_source.t_processed >= db_source.t_duration:
+                print(f'Video source {db_source.id} is already processed')
+                return
+            t_resume = db_source.t_processed
+            crud.truncate_inferences(db, schemas.SourceKind.Video, db_source.id, db_source.t_start + t_resume)
+            recent.clear(schemas.SourceKind.Video, db_source.id)
+            n_resumes = crud.resume_video_source_inferences(db, db_source.id)
+            # @NOTE: Tracker starts over, chunks already take TRACK_ID_STRIDE each
+            track_id_offset = n_resumes % RESUME_TRACK_ID_CYCLE * RESUME_TRACK_ID_STRIDE
+            print(f'Resuming video source {db_source.id} from {t_resume:.1f}s')
+        else:
+            crud.destroy_inferences(db, schemas.SourceKind.Video, db_source.id)
+            cleaner.notify()
+            recent.clear(schemas.SourceKind.Video, db_source.id)
+            crud.start_video_source_inferences(db, db_source.id, inference_params)
+
+        if db_source.is_offline and VIDEO_WORKERS > 1:
+            run_chunked(db, url, schemas.SourceKind.Video, db_source.id, db_source.t_start,
+                        motion_threshold=db_source.motion_threshold,
+                        analysis_fps=db_source.analysis_fps, frame_step=db_source.frame_step,
+                        cancel=job.cancel, on_progress=on_progress,
+                        t_resume=t_resume, track_id_offset=track_id_offset)
+            return
+
+        pipeline = InferencePipeline(db, url, schemas.SourceKind.Video, db_source.id, db_source.t_start,
+                                     motion_threshold=db_source.motion_threshold,
+                                     pace=not db_source.is_offline, offline=db_source.is_offline,
+                                     analysis_fps=db_source.analysis_fps, frame_step=db_source.frame_step,
+                                     cancel=job.cancel, on_progress=on_progress,
+                                     t_resume=t_resume, track_id_offset=track_id_offset)
+        pipeline.run()
+
+
+# @NOTE: Fields of a source that change what its job infers, other edits (e.g. a rename) keep the job running
+VIDEO_JOB_FIELDS = ('is_active', 'motion_threshold', 'is_offline', 'analysis_fps', 'frame_step')
+CAMERA_JOB_FIELDS = ('is_active', 'motion_threshold')
+
+
+def job_fields(db_source: models.VideoSource | models.CameraSource, fields: tuple[str, ...]) -> tuple:
+    return tuple(getattr(db_source, name) for name in fields)
+
+
+def submit_video_job(db_source: models.VideoSource, s3_client: BaseClient, full: bool = False):
+    cost = VIDEO_WORKERS if db_source.is_offline and VIDEO_WORKERS > 1 else 1
+    jobs.submit(schemas.SourceKind.Video, db_source.id, cost,
+                partial(infer_video_source_task, source_id=db_source.id, s3_client=s3_client, full=full))
+
+
+def infer_camera_source_task(job: Job, source_id: int):
+    # @NOTE: Own session, a job outlives the request that submitted it
+    with SessionLocal() as db:
+        db_source = crud.get_camera_source(db, source_id)
+        if db_source is None:
+            return
+
+        if not db_source.is_active:
+            return
+
+        url = db_source.private_url
+
+        crud.destroy_inferences(db, schemas.SourceKind.Camera, db_source.id)
+        cleaner.notify()
+        recent.clear(schemas.SourceKind.Camera, db_source.id)
+        pipeline = InferencePipeline(db, url, schemas.SourceKind.Camera, db_source.id, time.time(),
+                                     motion_threshold=db_source.motion_threshold, cancel=job.cancel)
+        pipeline.run()
+
+
+def submit_camera_job(db_source: models.CameraSource):
+    jobs.submit(schemas.SourceKind.Camera, db_source.id, 1, partial(infer_camera_source_task, source_id=db_source.id))
 
 
 @app.post('/v1/video-sources')
 def create_video_source(
         source: schemas.VideoSourceCreate,
-        background_tasks: BackgroundTasks,
         db: Session = Depends(get_db),
         s3_client=Depends(get_s3_client),
 ) -> schemas.VideoSource:
     db_source = crud.create_video_source(db, source)
-    background_tasks.add_task(infer_video_source_task, db_source.id, db, s3_client)
+    submit_video_job(db_source, s3_client)
     return db_source
 
 
@@ -265,28 +272,37 @@ def create_video_source(
 def update_video_source(
         source_id: int,
         source: schemas.VideoSourceUpdate,
-        background_tasks: BackgroundTasks,
         db: Session = Depends(get_db),
         s3_client=Depends(get_s3_client),
 ) -> schemas.VideoSource:
-    db_source = crud.update_video_source(db, source_id, source)
+    db_source = crud.get_video_source(db, source_id)
     if db_source is None:
         raise HTTPException(status_code=404, detail="Source not found")
-    background_tasks.add_task(infer_video_source_task, db_source.id, db, s3_client)
+    fields_before = job_fields(db_source, VIDEO_JOB_FIELDS)
+    db_source = crud.update_video_source(db, source_id, source)
+    # @NOTE: Stops a running job at once, instead of the runner polling is_active.
+    #        Other processes are only told when the job changes, they stop their job of the source.
+    if not db_source.is_active:
+        jobs.stop(schemas.SourceKind.Video, source_id)
+        notify_source_change(db, schemas.SourceKind.Video, source_id)
+    elif job_fields(db_source, VIDEO_JOB_FIELDS) != fields_before:
+        submit_video_job(db_source, s3_client)
+        notify_source_change(db, schemas.SourceKind.Video, source_id)
     return db_source
 
 
 @app.post('/v1/video-sources/{source_id}/tasks/infer')
 def infer_video_source(
         source_id: int,
-        background_tasks: BackgroundTasks,
+        full: bool = False,  # @DOC: recompute from the start even if the models and params did not change
         db: Session = Depends(get_db),
         s3_client=Depends(get_s3_client),
 ) -> schemas.VideoSource:
     db_source = crud.get_video_source(db, source_id)
     if db_source is None:
         raise HTTPException(status_code=404, detail="Source not found")
-    background_tasks.add_task(infer_video_source_task, db_source.id, db, s3_client)
+    submit_video_job(db_source, s3_client, full=full)
+    notify_source_change(db, schemas.SourceKind.Video, source_id)
     return db_source
 
 
@@ -295,16 +311,63 @@ def destroy_video_source(source_id: int, db: Session = Depends(get_db)) -> schem
     ok = crud.destroy_video_source(db, source_id)
     if ok is None:
         raise HTTPException(status_code=404, detail="Source not found")
+    jobs.stop(schemas.SourceKind.Video, source_id)
+    notify_source_change(db, schemas.SourceKind.Video, source_id)
     return schemas.Result(ok=ok)
 
 
+TIMELINE_MAX_BUCKETS = 100_000
+
+
+def check_timeline_range(t_from: float, t_to: float, bucket: float):
+    if bucket <= 0 or t_to <= t_from:
+        raise HTTPException(status_code=422, detail="Expected t_from < t_to and a positive bucket")
+    if (t_to - t_from) / bucket > TIMELINE_MAX_BUCKETS:
+        raise HTTPException(status_code=422, detail="Too many buckets, increase bucket")
+
+
+def inferences_stream(source_kind: schemas.SourceKind, source_id: int, since_t: float) -> StreamingResponse:
+    return StreamingResponse(inference_events(source_kind, source_id, since_t), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache'})
+
+
 @app.get("/v1/video-sources/{source_id}/inferences")
-def get_video_inferences(source_id: int, db: Session = Depends(get_db), since_t: float = 0, limit: int = 1000) -> list[
-    schemas.Inference]:
-    db_inferences = crud.get_inferences(db, schemas.SourceKind.Video, source_id, since_t, limit)
-    # @PERF: SQLAlchemy and Pydantic are sorta slow here when getting initial list,
-    #        but we manage by using t as cursor
-    return db_inferences
+def get_video_inferences(source_id: int, db: Session = Depends(get_db), since_t: float = 0, limit: int = 1000,
+                         accept: str | None = Header(None)) -> list[schemas.Inference]:
+    # @PERF: Raw rows encoded directly, SQLAlchemy objects and Pydantic were slow for the initial list.
+    #        Response model is kept for the schema, the JSON response is the same as it would produce.
+    #        Accept: application/msgpack gets the same data as columns, see src.encoding.encode_msgpack_columns
+    #        Recent inferences come from memory, see src.recent
+    rows = get_inference_rows(db, schemas.SourceKind.Video, source_id, since_t, limit)
+    return inferences_response(rows, accept)
+
+
+# @NOTE: Live push instead of polling the endpoint above, see src.pubsub.inference_events
+@app.get("/v1/video-sources/{source_id}/inferences/stream")
+def stream_video_inferences(source_id: int, since_t: float = 0) -> StreamingResponse:
+    return inferences_stream(schemas.SourceKind.Video, source_id, since_t)
+
+
+@app.get("/v1/video-sources/{source_id}/timeline")
+def get_video_timeline(source_id: int, t_from: float, t_to: float, bucket: float = 5, min_c: float = 0,
+                       db: Session = Depends(get_db)) -> list[schemas.TimelineBucket]:
+    check_timeline_range(t_from, t_to, bucket)
+    return crud.get_timeline(db, schemas.SourceKind.Video, source_id, t_from, t_to, bucket, min_c)
+
+
+@app.get("/v1/video-sources/{source_id}/job")
+def get_video_job(source_id: int) -> schemas.Job:
+    job = jobs.get(schemas.SourceKind.Video, source_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# @NOTE: Inferences only have frames with hits, coverage tells which spans were analyzed at all
+@app.get("/v1/video-sources/{source_id}/coverage")
+def get_video_coverage(source_id: int, db: Session = Depends(get_db), since_t: float = 0) -> list[
+    schemas.InferenceCoverage]:
+    return crud.get_inference_coverages(db, schemas.SourceKind.Video, source_id, since_t)
 
 
 @app.get("/v1/camera-sources")
@@ -316,7 +379,6 @@ def read_camera_sources(db: Session = Depends(get_db)) -> list[schemas.CameraSou
 @app.post('/v1/camera-sources')
 async def create_camera_source(
         source: schemas.CameraSourceCreate,
-        background_tasks: BackgroundTasks,
         db: Session = Depends(get_db),
         s3_client=Depends(get_s3_client),
 ) -> schemas.CameraSource:
@@ -324,7 +386,7 @@ async def create_camera_source(
     mmtx_base_url = getenv("MMTX_API_URL")
     httpx.post(mmtx_base_url + f'/v3/config/paths/add/{mmtx_name}', json={'source': source.private_url.strip()})
     db_source = crud.create_camera_source(db, source, mmtx_name)
-    background_tasks.add_task(infer_camera_source_task, db_source.id, db, s3_client)
+    submit_camera_job(db_source)
     return db_source
 
 
@@ -332,28 +394,36 @@ async def create_camera_source(
 def update_camera_source(
         source_id: int,
         source: schemas.CameraSourceUpdate,
-        background_tasks: BackgroundTasks,
         db: Session = Depends(get_db),
         s3_client=Depends(get_s3_client),
 ) -> schemas.CameraSource:
-    db_source = crud.update_camera_source(db, source_id, source)
+    db_source = crud.get_camera_source(db, source_id)
     if db_source is None:
         raise HTTPException(status_code=404, detail="Source not found")
-    background_tasks.add_task(infer_camera_source_task, db_source.id, db, s3_client)
+    fields_before = job_fields(db_source, CAMERA_JOB_FIELDS)
+    db_source = crud.update_camera_source(db, source_id, source)
+    # @NOTE: Stops a running job at once, instead of the runner polling is_active.
+    #        Other processes are only told when the job changes, they stop their job of the source.
+    if not db_source.is_active:
+        jobs.stop(schemas.SourceKind.Camera, source_id)
+        notify_source_change(db, schemas.SourceKind.Camera, source_id)
+    elif job_fields(db_source, CAMERA_JOB_FIELDS) != fields_before:
+        submit_camera_job(db_source)
+        notify_source_change(db, schemas.SourceKind.Camera, source_id)
     return db_source
 
 
 @app.post('/v1/camera-sources/{source_id}/tasks/infer')
 def infer_camera_source(
         source_id: int,
-        background_tasks: BackgroundTasks,
         db: Session = Depends(get_db),
         s3_client=Depends(get_s3_client),
 ) -> schemas.CameraSource:
     db_source = crud.get_camera_source(db, source_id)
     if db_source is None:
         raise HTTPException(status_code=404, detail="Source not found")
-    background_tasks.add_task(infer_camera_source_task, db_source.id, db, s3_client)
+    submit_camera_job(db_source)
+    notify_source_change(db, schemas.SourceKind.Camera, source_id)
     return db_source
 
 
@@ -362,13 +432,44 @@ def destroy_camera_source(source_id: int, db: Session = Depends(get_db)) -> sche
     ok = crud.destroy_camera_source(db, source_id)
     if ok is None:
         raise HTTPException(status_code=404, detail="Source not found")
+    jobs.stop(schemas.SourceKind.Camera, source_id)
+    notify_source_change(db, schemas.SourceKind.Camera, source_id)
     return schemas.Result(ok=ok)
 
 
 @app.get("/v1/camera-sources/{source_id}/inferences")
-def get_camera_inferences(source_id: int, db: Session = Depends(get_db), since_t: float = 0, limit: int = 1000) -> list[
-    schemas.Inference]:
-    db_inferences = crud.get_inferences(db, schemas.SourceKind.Camera, source_id, since_t, limit)
-    # @PERF: SQLAlchemy and Pydantic are sorta slow here when getting initial list,
-    #        but we manage by using t as cursor
-    return db_inferences
+def get_camera_inferences(source_id: int, db: Session = Depends(get_db), since_t: float = 0, limit: int = 1000,
+                          accept: str | None = Header(None)) -> list[schemas.Inference]:
+    # @PERF: Raw rows encoded directly, SQLAlchemy objects and Pydantic were slow for the initial list.
+    #        Response model is kept for the schema, the JSON response is the same as it would produce.
+    #        Accept: application/msgpack gets the same data as columns, see src.encoding.encode_msgpack_columns
+    #        Recent inferences come from memory, see src.recent
+    rows = get_inference_rows(db, schemas.SourceKind.Camera, source_id, since_t, limit)
+    return inferences_response(rows, accept)
+
+
+# @NOTE: Live push instead of polling the endpoint above, see src.pubsub.inference_events
+@app.get("/v1/camera-sources/{source_id}/inferences/stream")
+def stream_camera_inferences(source_id: int, since_t: float = 0) -> StreamingResponse:
+    return inferences_stream(schemas.SourceKind.Camera, source_id, since_t)
+
+
+@app.get("/v1/camera-sources/{source_id}/timeline")
+def get_camera_timeline(source_id: int, t_from: float, t_to: float, bucket: float = 5, min_c: float = 0,
+                        db: Session = Depends(get_db)) -> list[schemas.TimelineBucket]:
+    check_timeline_range(t_from, t_to, bucket)
+    return crud.get_timeline(db, schemas.SourceKind.Camera, source_id, t_from, t_to, bucket, min_c)
+
+
+@app.get("/v1/camera-sources/{source_id}/job")
+def get_camera_job(source_id: int) -> schemas.Job:
+    job = jobs.get(schemas.SourceKind.Camera, source_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/v1/camera-sources/{source_id}/coverage")
+def get_camera_coverage(source_id: int, db: Session = Depends(get_db), since_t: float = 0) -> list[
+    schemas.InferenceCoverage]:
+    return crud.get_inference_coverages(db, schemas.SourceKind.Camera, source_id, since_t)
@@ -0,0 +1,41 @@
+from prometheus_client import Counter, Histogram
+
+from src import schemas
+
+LABELS = ['source_kind', 'source_id']
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0)
+HITS_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+GRAB_SECONDS = Histogram('guns_grab_seconds', 'Time to grab a frame from the stream', LABELS,
+                         buckets=LATENCY_BUCKETS)
+RETRIEVE_SECONDS = Histogram('guns_retrieve_seconds', 'Time to decode a grabbed frame', LABELS,
+                             buckets=LATENCY_BUCKETS)
+POSE_SECONDS = Histogram('guns_pose_seconds', 'Pose inference and tracking time per frame', LABELS,
+                         buckets=LATENCY_BUCKETS)
+GUN_SECONDS = Histogram('guns_gun_seconds', 'Gun inference time per frame, including crops', LABELS,
+                        buckets=LATENCY_BUCKETS)
+HITS = Histogram('guns_hits', 'Number of hits per frame', LABELS, buckets=HITS_BUCKETS)
+DB_WRITE_SECONDS = Histogram('guns_db_write_seconds', 'Time to persist inferences', LABELS,
+                             buckets=LATENCY_BUCKETS)
+FRAMES_PROCESSED = Counter('guns_frames_processed', 'Frames that went through inference', LABELS)
+FRAMES_DROPPED = Counter('guns_frames_dropped', 'Frames dropped because inference was busy', LABELS)
+FRAMES_SKIPPED = Counter('guns_frames_skipped', 'Frames skipped before inference', LABELS + ['reason'])
+INFERENCE_READS = Counter('guns_inference_reads', 'Inference list reads by where they were served from',
+                          ['source_kind', 'served_from'])
+
+
+# @NOTE: Metrics with labels bound to one source, labels() lookups are not free on the hot path
+class SourceMetrics:
+    def __init__(self, source_kind: schemas.SourceKind, source_id: int):
+        labels = dict(source_kind=source_kind.value, source_id=str(source_id))
+        self.grab_seconds = GRAB_SECONDS.labels(**labels)
+        self.retrieve_seconds = RETRIEVE_SECONDS.labels(**labels)
+        self.pose_seconds = POSE_SECONDS.labels(**labels)
+        self.gun_seconds = GUN_SECONDS.labels(**labels)
+        self.hits = HITS.labels(**labels)
+        self.db_write_seconds = DB_WRITE_SECONDS.labels(**labels)
+        self.frames_processed = FRAMES_PROCESSED.labels(**labels)
+        self.frames_dropped = FRAMES_DROPPED.labels(**labels)
+        self.frames_skipped_behind = FRAMES_SKIPPED.labels(**labels, reason='behind')
+        self.frames_skipped_static = FRAMES_SKIPPED.labels(**labels, reason='static')
+        self.frames_skipped_sampling = FRAMES_SKIPPED.labels(**labels, reason='sampling')
@@ -0,0 +1,31 @@
+"""add inferences cursor indexes
+
+Revision ID: b52e7a9c3d18
+Revises: 7d4e9b20c1f6
+Create Date: 2026-10-18 13:41:07.530912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52e7a9c3d18'
+down_revision: Union[str, None] = '7d4e9b20c1f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # @NOTE: Concurrently, so that capture loops can keep writing while indexes are built on a large table
+    with op.get_context().autocommit_block():
+        op.create_index('ix_inferences_source_kind_source_id_t', 'inferences', ['source_kind', 'source_id', 't'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_inference_hits_inference_id'), 'inference_hits', ['inference_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_inference_hits_inference_id'), table_name='inference_hits', postgresql_concurrently=True)
+        op.drop_index('ix_inferences_source_kind_source_id_t', table_name='inferences', postgresql_concurrently=True)
@@ -0,0 +1,191 @@
+"""partition inferences
+
+Revision ID: c7e2f9a41d85
+Revises: 9f3b5d71e2a4
+Create Date: 2026-10-18 16:37:25.913840
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e2f9a41d85'
+down_revision: Union[str, None] = '9f3b5d71e2a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DAY = 24 * 60 * 60
+DAYS_AHEAD = 7  # @NOTE: Same as src.retention.PARTITION_DAYS_AHEAD, later days are created by the app
+
+
+def create_camera_partitions(conn, t_min: float | None):
+    # @NOTE: Daily partitions for camera data that already exists and for the next days
+    today = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) // DAY * DAY
+    day = int(t_min) // DAY * DAY if t_min is not None else today
+    while day <= today + DAYS_AHEAD * DAY:
+        suffix = datetime.datetime.fromtimestamp(day, datetime.timezone.utc).strftime('%Y%m%d')
+        for table in ['inferences', 'inference_hits']:
+            conn.execute(sa.text(f'''
+                CREATE TABLE {table}_camera_{suffix} PARTITION OF {table}_camera
+                FOR VALUES FROM ({day}) TO ({day + DAY})
+            '''))
+        day += DAY
+
+
+def upgrade() -> None:
+    op.create_table('inference_wipes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source_kind', postgresql.ENUM('Video', 'Camera', 'Config', name='sourcekind', create_type=False), nullable=True),
+    sa.Column('source_id', sa.Integer(), nullable=True),
+    sa.Column('inference_id_to', sa.Integer(), nullable=True, comment='Inferences of the source up to this id are deleted'),
+    sa.Column('coverage_id_to', sa.Integer(), nullable=True, comment='Coverages of the source up to this id are deleted'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inference_wipes_id'), 'inference_wipes', ['id'], unique=False)
+    op.create_index('ix_inference_wipes_source_kind_source_id', 'inference_wipes', ['source_kind', 'source_id'], unique=False)
+
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        # @NOTE: No partitioning elsewhere, hits only get the columns they are partitioned by
+        op.add_column('inference_hits', sa.Column('t', sa.Double(), nullable=True))
+        op.add_column('inference_hits', sa.Column('source_kind', sa.Enum('Video', 'Camera', 'Config', name='sourcekind'), nullable=True))
+        conn.execute(sa.text('''
+            UPDATE inference_hits SET
+                t = (SELECT t FROM inferences WHERE inferences.id = inference_hits.inference_id),
+                source_kind = (SELECT source_kind FROM inferences WHERE inferences.id = inference_hits.inference_id)
+        '''))
+        return
+
+    # @NOTE: Both tables are partitioned by source kind, camera data further by day of t, so that retention
+    #        drops whole partitions. Video is not split by time, since t of an uploaded video is its recording time.
+    #        Hits carry t and source_kind of their inference to be partitioned the same way.
+    #        Partition keys have to be part of the primary key, so the foreign key from hits to inferences is gone.
+    conn.execute(sa.text('''
+        ALTER TABLE inferences RENAME TO inferences_old;
+        ALTER TABLE inference_hits RENAME TO inference_hits_old;
+        ALTER TABLE inferences_old RENAME CONSTRAINT inferences_pkey TO inferences_old_pkey;
+        ALTER TABLE inference_hits_old RENAME CONSTRAINT inference_hits_pkey TO inference_hits_old_pkey;
+        ALTER SEQUENCE inferences_id_seq OWNED BY NONE;
+        ALTER SEQUENCE inference_hits_id_seq OWNED BY NONE;
+
+        CREATE TABLE inferences (
+            id integer NOT NULL DEFAULT nextval('inferences_id_seq'),
+            t double precision NOT NULL,
+            source_kind sourcekind NOT NULL,
+            source_id integer,
+            hits_packed bytea,
+            PRIMARY KEY (id, source_kind, t)
+        ) PARTITION BY LIST (source_kind);
+        CREATE TABLE inferences_video PARTITION OF inferences FOR VALUES IN ('Video');
+        CREATE TABLE inferences_camera PARTITION OF inferences FOR VALUES IN ('Camera') PARTITION BY RANGE (t);
+        CREATE TABLE inferences_camera_default PARTITION OF inferences_camera DEFAULT;
+        CREATE TABLE inferences_default PARTITION OF inferences DEFAULT;
+
+        CREATE TABLE inference_hits (
+            id integer NOT NULL DEFAULT nextval('inference_hits_id_seq'),
+            x double precision,
+            y double precision,
+            w double precision,
+            h double precision,
+            c double precision,
+            track_id integer,
+            inference_id integer,
+            file_id integer REFERENCES files (id),
+            t double precision NOT NULL,
+            source_kind sourcekind NOT NULL,
+            PRIMARY KEY (id, source_kind, t)
+        ) PARTITION BY LIST (source_kind);
+        CREATE TABLE inference_hits_video PARTITION OF inference_hits FOR VALUES IN ('Video');
+        CREATE TABLE inference_hits_camera PARTITION OF inference_hits FOR VALUES IN ('Camera') PARTITION BY RANGE (t);
+        CREATE TABLE inference_hits_camera_default PARTITION OF inference_hits_camera DEFAULT;
+        CREATE TABLE inference_hits_default PARTITION OF inference_hits DEFAULT;
+    '''))
+    conn.execute(sa.text('''
+        COMMENT ON COLUMN inferences.hits_packed IS 'Hits as packed x, y, w, h, c float32 and track_id int32';
+        COMMENT ON COLUMN inference_hits.c IS 'Confidence';
+    '''))
+    t_min = conn.execute(sa.text("SELECT min(t) FROM inferences_old WHERE source_kind = 'Camera'")).scalar()
+    create_camera_partitions(conn, t_min)
+
+    conn.execute(sa.text('''
+        INSERT INTO inferences (id, t, source_kind, source_id, hits_packed)
+        SELECT id, t, source_kind, source_id, hits_packed FROM inferences_old WHERE t IS NOT NULL AND source_kind IS NOT NULL;
+        INSERT INTO inference_hits (id, x, y, w, h, c, track_id, inference_id, file_id, t, source_kind)
+        SELECT h.id, h.x, h.y, h.w, h.h, h.c, h.track_id, h.inference_id, h.file_id, i.t, i.source_kind
+        FROM inference_hits_old h JOIN inferences_old i ON i.id = h.inference_id
+        WHERE i.t IS NOT NULL AND i.source_kind IS NOT NULL;
+
+        DROP TABLE inference_hits_old;
+        DROP TABLE inferences_old;
+        ALTER SEQUENCE inferences_id_seq OWNED BY inferences.id;
+        ALTER SEQUENCE inference_hits_id_seq OWNED BY inference_hits.id;
+    '''))
+    op.create_index(op.f('ix_inferences_id'), 'inferences', ['id'], unique=False)
+    op.create_index('ix_inferences_source_kind_source_id_t', 'inferences', ['source_kind', 'source_id', 't'], unique=False)
+    op.create_index(op.f('ix_inference_hits_id'), 'inference_hits', ['id'], unique=False)
+    op.create_index(op.f('ix_inference_hits_inference_id'), 'inference_hits', ['inference_id'], unique=False)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        op.drop_column('inference_hits', 'source_kind')
+        op.drop_column('inference_hits', 't')
+    else:
+        conn.execute(sa.text('''
+            ALTER TABLE inferences RENAME TO inferences_partitioned;
+            ALTER TABLE inference_hits RENAME TO inference_hits_partitioned;
+            ALTER TABLE inferences_partitioned RENAME CONSTRAINT inferences_pkey TO inferences_partitioned_pkey;
+            ALTER TABLE inference_hits_partitioned RENAME CONSTRAINT inference_hits_pkey TO inference_hits_partitioned_pkey;
+            ALTER SEQUENCE inferences_id_seq OWNED BY NONE;
+            ALTER SEQUENCE inference_hits_id_seq OWNED BY NONE;
+            DROP INDEX ix_inferences_id;
+            DROP INDEX ix_inferences_source_kind_source_id_t;
+            DROP INDEX ix_inference_hits_id;
+            DROP INDEX ix_inference_hits_inference_id;
+
+            CREATE TABLE inferences (
+                id integer NOT NULL DEFAULT nextval('inferences_id_seq') PRIMARY KEY,
+                t double precision,
+                source_kind sourcekind,
+                source_id integer,
+                hits_packed bytea
+            );
+            CREATE TABLE inference_hits (
+                id integer NOT NULL DEFAULT nextval('inference_hits_id_seq') PRIMARY KEY,
+                x double precision,
+                y double precision,
+                w double precision,
+                h double precision,
+                inference_id integer REFERENCES inferences (id),
+                file_id integer REFERENCES files (id),
+                c double precision,
+                track_id integer
+            );
+            COMMENT ON COLUMN inferences.hits_packed IS 'Hits as packed x, y, w, h, c float32 and track_id int32';
+            COMMENT ON COLUMN inference_hits.c IS 'Confidence';
+
+            INSERT INTO inferences (id, t, source_kind, source_id, hits_packed)
+            SELECT id, t, source_kind, source_id, hits_packed FROM inferences_partitioned;
+            INSERT INTO inference_hits (id, x, y, w, h, inference_id, file_id, c, track_id)
+            SELECT id, x, y, w, h, inference_id, file_id, c, track_id FROM inference_hits_partitioned;
+
+            DROP TABLE inference_hits_partitioned;
+            DROP TABLE inferences_partitioned;
+            ALTER SEQUENCE inferences_id_seq OWNED BY inferences.id;
+            ALTER SEQUENCE inference_hits_id_seq OWNED BY inference_hits.id;
+        '''))
+        op.create_index(op.f('ix_inferences_id'), 'inferences', ['id'], unique=False)
+        op.create_index('ix_inferences_source_kind_source_id_t', 'inferences', ['source_kind', 'source_id', 't'], unique=False)
+        op.create_index(op.f('ix_inference_hits_id'), 'inference_hits', ['id'], unique=False)
+        op.create_index(op.f('ix_inference_hits_inference_id'), 'inference_hits', ['inference_id'], unique=False)
+
+    op.drop_index('ix_inference_wipes_source_kind_source_id', table_name='inference_wipes')
+    op.drop_index(op.f('ix_inference_wipes_id'), table_name='inference_wipes')
+    op.drop_table('inference_wipes')
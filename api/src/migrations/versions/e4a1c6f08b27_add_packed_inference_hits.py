@@ -0,0 +1,56 @@
+"""add packed inference hits
+
+Revision ID: e4a1c6f08b27
+Revises: b52e7a9c3d18
+Create Date: 2026-10-18 15:02:44.108236
+
+"""
+import struct
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a1c6f08b27'
+down_revision: Union[str, None] = 'b52e7a9c3d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# @NOTE: Same layout as src.packing.HIT_DTYPE, copied so that the migration does not change with the app
+HIT_FORMAT = struct.Struct('<5fi')
+BATCH_SIZE = 10000
+
+
+def convert(conn, select_batch, convert_batch):
+    # @NOTE: In id ranges, so that a large history is not loaded at once
+    max_id = conn.execute(sa.text('SELECT max(id) FROM inferences')).scalar() or 0
+    for id_from in range(0, max_id + 1, BATCH_SIZE):
+        rows = conn.execute(select_batch, dict(id_from=id_from, id_to=id_from + BATCH_SIZE)).all()
+        convert_batch(conn, rows)
+
+
+def unpack_batch(conn, rows):
+    hit_rows = []
+    for inference_id, hits_packed in rows:
+        for x, y, w, h, c, track_id in HIT_FORMAT.iter_unpack(hits_packed):
+            hit_rows.append(dict(x=x, y=y, w=w, h=h, c=c, track_id=None if track_id == -1 else track_id,
+                                 inference_id=inference_id))
+    if len(hit_rows) > 0:
+        conn.execute(sa.text('INSERT INTO inference_hits (x, y, w, h, c, track_id, inference_id) '
+                             'VALUES (:x, :y, :w, :h, :c, :track_id, :inference_id)'), hit_rows)
+
+
+def upgrade() -> None:
+    op.add_column('inferences', sa.Column('hits_packed', sa.LargeBinary(), nullable=True, comment='Hits as packed x, y, w, h, c float32 and track_id int32'))
+    # @NOTE: Schema only, existing hits stay rows, which reads handle next to packed ones.
+    #        They are converted on demand with `python -m src.convert_hits --to packed`.
+
+
+def downgrade() -> None:
+    convert(op.get_bind(), sa.text('''
+        SELECT id, hits_packed FROM inferences
+        WHERE id >= :id_from AND id < :id_to AND hits_packed IS NOT NULL
+    '''), unpack_batch)
+    op.drop_column('inferences', 'hits_packed')
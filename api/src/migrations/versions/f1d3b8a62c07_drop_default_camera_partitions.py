@@ -0,0 +1,55 @@
+"""drop default camera partitions
+
+Revision ID: f1d3b8a62c07
+Revises: 5e8a2c7d9b14
+Create Date: 2026-10-18 21:04:12.581930
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1d3b8a62c07'
+down_revision: Union[str, None] = '5e8a2c7d9b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DAY = 24 * 60 * 60
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    # @NOTE: Postgres does not detach partitions concurrently while a default partition exists, so retention could
+    #        only drop days under an ACCESS EXCLUSIVE lock of the parent. Rows of the default partitions get daily
+    #        partitions of their own instead, the app keeps creating days ahead of time.
+    for table in ['inferences', 'inference_hits']:
+        conn.execute(sa.text(f'ALTER TABLE {table}_camera DETACH PARTITION {table}_camera_default'))
+        days = conn.execute(sa.text(f'''
+            SELECT DISTINCT floor(t / {DAY})::bigint * {DAY} FROM {table}_camera_default
+        ''')).scalars().all()
+        for day in days:
+            suffix = datetime.datetime.fromtimestamp(day, datetime.timezone.utc).strftime('%Y%m%d')
+            conn.execute(sa.text(f'''
+                CREATE TABLE IF NOT EXISTS {table}_camera_{suffix} PARTITION OF {table}_camera
+                FOR VALUES FROM ({day}) TO ({day + DAY})
+            '''))
+        conn.execute(sa.text(f'''
+            INSERT INTO {table}_camera SELECT * FROM {table}_camera_default;
+            DROP TABLE {table}_camera_default;
+        '''))
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    for table in ['inferences', 'inference_hits']:
+        conn.execute(sa.text(f'CREATE TABLE {table}_camera_default PARTITION OF {table}_camera DEFAULT'))
@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+from enum import Enum
+from os import getenv, path, makedirs, remove
+
+from ultralytics import YOLO
+from ultralytics.utils.downloads import attempt_download_asset
+
+# @NOTE: auto | torch-cuda | torch-cpu | onnx | openvino
+ML_BACKEND = getenv('ML_BACKEND', 'auto')
+ML_CACHE_DIR = getenv('ML_CACHE_DIR', path.join(path.dirname(__file__), '.cache'))
+
+
+class Backend(Enum):
+    TorchCuda = 'torch-cuda'
+    TorchCpu = 'torch-cpu'
+    Onnx = 'onnx'
+    OpenVino = 'openvino'
+
+
+def detect_backend() -> Backend:
+    if ML_BACKEND != 'auto':
+        return Backend(ML_BACKEND)
+
+    import torch
+    if torch.cuda.is_available():
+        return Backend.TorchCuda
+
+    try:
+        import onnxruntime
+        return Backend.Onnx
+    except ImportError:
+        pass
+
+    return Backend.TorchCpu
+
+
+def exported_path(weights: str, backend: Backend) -> str:
+    stem = path.splitext(path.basename(weights))[0]
+    # @NOTE: Parent dir is part of the name, because all trained weights are called best.pt
+    parent = path.basename(path.dirname(path.dirname(path.abspath(weights))))
+    name = f'{parent}_{stem}' if parent else stem
+    if backend == Backend.Onnx:
+        return path.join(ML_CACHE_DIR, f'{name}.onnx')
+    if backend == Backend.OpenVino:
+        return path.join(ML_CACHE_DIR, f'{name}_openvino_model')
+    raise ValueError(f'Backend {backend.value} is not exportable')
+
+
+def export_model(weights: str, backend: Backend) -> str:
+    target = exported_path(weights, backend)
+    # @NOTE: Reuse the cached export unless the weights changed since
+    if path.exists(target) and (not path.exists(weights) or path.getmtime(target) >= path.getmtime(weights)):
+        return target
+
+    makedirs(ML_CACHE_DIR, exist_ok=True)
+    # @NOTE: Ultralytics exports next to the weights, which would overwrite exports tracked in the repo
+    #        (e.g. train9/weights/best_openvino_model), so it exports from a copy instead
+    workdir = tempfile.mkdtemp(dir=ML_CACHE_DIR)
+    try:
+        # @NOTE: Pose weights are not in the repo, ultralytics downloads them by name on first use
+        copied = shutil.copy2(attempt_download_asset(weights), workdir)
+        # @NOTE: Dynamic axes so that the gun detector can take a batch of crops
+        exported = YOLO(copied).export(format=backend.value, dynamic=True, verbose=False)
+        if path.exists(target):
+            if path.isdir(target):
+                shutil.rmtree(target)
+            else:
+                remove(target)
+        shutil.move(exported, target)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return target
+
+
+def load_model(weights: str, task: str, backend: Backend) -> YOLO:
+    if backend == Backend.TorchCuda:
+        return YOLO(weights, task=task).to('cuda')
+    if backend == Backend.TorchCpu:
+        return YOLO(weights, task=task).to('cpu')
+    return YOLO(export_model(weights, backend), task=task)
@@ -1,23 +1,110 @@
-from os import path
+import hashlib
+import time
+from os import path, getenv
+from typing import NamedTuple
 
 import cv2
-from ultralytics import YOLO
 import numpy as np
 
 from src import schemas
+from src.ml.registry import ModelRegistry, registry
+from src.ml.scheduler import BatchScheduler
+from src.ml.tracker import StreamTracker
+
+POSE_WEIGHTS = 'yolov8n-pose.pt'
+GUN_WEIGHTS = path.join(path.dirname(__file__), "./train9/weights/best.pt")
+GUN_IMGSZ = 640  # @NOTE: Gun detector was trained on 640x640
+GUN_BATCH_SIZE = 16
+GUN_REUSE_FRAMES = int(getenv('GUN_REUSE_FRAMES', '5'))  # @NOTE: 1 disables reuse
+GUN_REUSE_SHIFT = 0.1  # @NOTE: Fraction of box size
+GUN_REUSE_SCALE = 0.1
+
+
+class PersonCrop(NamedTuple):
+    track_id: int
+    l: int
+    t: int
+    r: int
+    b: int
+
+
+# @NOTE: Gun boxes are stored relative to the crop (cx, cy, w, h in 0..1 of the crop, and confidence),
+#        so they can be re-projected onto the current box of the track
+class TrackResult(NamedTuple):
+    n_frame: int
+    crop: PersonCrop
+    boxes: list[tuple[float, float, float, float, float]]
+
+
+def letterbox(image: np.ndarray, size: int) -> tuple[np.ndarray, float, int, int]:
+    h, w = image.shape[0:2]
+    scale = min(size / h, size / w)
+    nh, nw = max(1, round(h * scale)), max(1, round(w * scale))
+    resized = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    pad_x = (size - nw) // 2
+    pad_y = (size - nh) // 2
+    boxed = np.full((size, size, 3), 114, dtype=image.dtype)
+    boxed[pad_y:pad_y + nh, pad_x:pad_x + nw] = resized
+    return boxed, scale, pad_x, pad_y
+
+
+# @NOTE: Pose model is shared by all streams, so frames from different streams are batched together
+pose_scheduler = BatchScheduler(POSE_WEIGHTS, 'pose')
+
+
+def weights_digest(weights: str) -> str:
+    # @NOTE: Pose weights are downloaded by name on first load, so the name identifies them while they are missing
+    if not path.exists(weights):
+        return path.basename(weights)
+    digest = hashlib.sha256()
+    with open(weights, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+# @NOTE: Identifies everything of the models that changes results, stored inferences of another version are recomputed
+def model_version() -> str:
+    return (f'pose:{weights_digest(POSE_WEIGHTS)},gun:{weights_digest(GUN_WEIGHTS)},'
+            f'imgsz:{GUN_IMGSZ},reuse:{GUN_REUSE_FRAMES}')
+
+
+def warm_up(models: ModelRegistry = registry):
+    models.get(POSE_WEIGHTS, 'pose')
+    models.get(GUN_WEIGHTS, 'detect')
+
 
 # @NOTE: Human pose detector + gun detector
+#        Models are shared through the registry, runner only owns per-stream tracker state
 class Runner:
-    def __init__(self):
-        self.model = YOLO('yolov8n-pose.pt').to('cuda')
-        self.sub_model = YOLO(path.join(path.dirname(__file__), "./train9/weights/best.pt")).to('cuda')
+    def __init__(self, models: ModelRegistry = registry, scheduler: BatchScheduler = pose_scheduler):
+        self.models = models
+        self.scheduler = scheduler
+        self.tracker = StreamTracker()
+        self.n_frame = 0
+        self.reuse_frames = GUN_REUSE_FRAMES
+        self.track_results: dict[int, TrackResult] = {}
+        self.timings: dict[str, float] = {}  # @NOTE: Seconds per stage of the last infer() call
+
+    def timed(self, stage: str, t0: float) -> float:
+        t1 = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (t1 - t0)
+        return t1
 
     def infer(self, frame: np.ndarray, t_seconds: float) -> list[schemas.InferenceHitCreate]:
-        res = self.model.track(frame, persist=True, verbose=False)[0]
+        self.timings = {}
+        t0 = time.perf_counter()
+        res = self.scheduler.predict(frame)
+        res = self.tracker.update(res, frame)
+        t0 = self.timed('pose', t0)
+        crops = self.crop_persons(frame, res)
+        self.timed('crop', t0)
+        return self.detect_guns(frame, crops)
 
+    def crop_persons(self, frame: np.ndarray, res) -> list[PersonCrop]:
         fh, fw = frame.shape[0:2]
 
-        hits: list[schemas.InferenceHitCreate] = []
+        crops: list[PersonCrop] = []
         for idx in range(len(res)):
             keypoints = res.keypoints[idx]
             c1 = keypoints.conf[0].median().tolist()  # @NOTE: Median pose confidence works much better than label confidence
@@ -45,16 +132,72 @@ class Runner:
             if (t >= b) or (l >= r):
                 continue
 
-            sub_frame = frame[t:b, l:r]
-            if sub_frame.shape[0] == 0 or sub_frame.shape[1] == 0:
-                continue
-            sub_res = self.sub_model(sub_frame, verbose=False)[0]
-            for sub_box in sub_res.boxes:
-                cx2, cy2, w2, h2 = sub_box.xywh[0].tolist()
-                c2 = sub_box.conf[0].tolist()
+            crops.append(PersonCrop(track_id, l, t, r, b))
+
+        return crops
+
+    def is_stale(self, crop: PersonCrop) -> bool:
+        prev = self.track_results.get(crop.track_id)
+        if prev is None or self.n_frame - prev.n_frame >= self.reuse_frames:
+            return True
+
+        pw, ph = prev.crop.r - prev.crop.l, prev.crop.b - prev.crop.t
+        w, h = crop.r - crop.l, crop.b - crop.t
+        dx = abs((crop.l + crop.r) - (prev.crop.l + prev.crop.r)) / 2
+        dy = abs((crop.t + crop.b) - (prev.crop.t + prev.crop.b)) / 2
+        if dx > GUN_REUSE_SHIFT * pw or dy > GUN_REUSE_SHIFT * ph:
+            return True
+        if abs(w / pw - 1) > GUN_REUSE_SCALE or abs(h / ph - 1) > GUN_REUSE_SCALE:
+            return True
+        return False
+
+    def detect_guns(self, frame: np.ndarray, crops: list[PersonCrop]) -> list[schemas.InferenceHitCreate]:
+        fh, fw = frame.shape[0:2]
+        self.n_frame += 1
+
+        # @PERF: Gun detector only re-runs for tracks that are new, moved, or were not checked for a while
+        stale = [crop for crop in crops if self.is_stale(crop)]
+        if len(stale) > 0:
+            guns = self.models.get(GUN_WEIGHTS, 'detect')
+        # @PERF: All crops share the same letterboxed shape, so they go through the gun detector as one batch
+        for i in range(0, len(stale), GUN_BATCH_SIZE):
+            batch = stale[i:i + GUN_BATCH_SIZE]
+            t0 = time.perf_counter()
+            images = [letterbox(frame[crop.t:crop.b, crop.l:crop.r], GUN_IMGSZ) for crop in batch]
+            t0 = self.timed('crop', t0)
+            with guns.lock:
+                sub_results = guns.model([image for image, _, _, _ in images], imgsz=GUN_IMGSZ, verbose=False)
+            for crop, (_, scale, pad_x, pad_y), sub_res in zip(batch, images, sub_results):
+                cw, ch = crop.r - crop.l, crop.b - crop.t
+                boxes = []
+                for sub_box in sub_res.boxes:
+                    cx2, cy2, w2, h2 = sub_box.xywh[0].tolist()
+                    c2 = sub_box.conf[0].tolist()
+                    # @NOTE: Undo letterbox, then normalize to the crop
+                    cx2 = (cx2 - pad_x) / scale / cw
+                    cy2 = (cy2 - pad_y) / scale / ch
+                    w2 = w2 / scale / cw
+                    h2 = h2 / scale / ch
+                    boxes.append((cx2, cy2, w2, h2, c2))
+                self.track_results[crop.track_id] = TrackResult(self.n_frame, crop, boxes)
+            self.timed('gun', t0)
+
+        t0 = time.perf_counter()
+        # @NOTE: Forget tracks that are gone
+        track_ids = set(crop.track_id for crop in crops)
+        for track_id in list(self.track_results.keys()):
+            if track_id not in track_ids:
+                del self.track_results[track_id]
+
+        hits: list[schemas.InferenceHitCreate] = []
+        for crop in crops:
+            cw, ch = crop.r - crop.l, crop.b - crop.t
+            for cx2, cy2, w2, h2, c2 in self.track_results[crop.track_id].boxes:
                 # @NOTE: x and y are expected to be centers of the bounding box
-                hit = schemas.InferenceHitCreate(x=(l + cx2) / fw, y=(t + cy2) / fh, w=w2 / fw, h=h2 / fh, c=c2, track_id=track_id)
+                hit = schemas.InferenceHitCreate(x=(crop.l + cx2 * cw) / fw, y=(crop.t + cy2 * ch) / fh,
+                                                 w=w2 * cw / fw, h=h2 * ch / fh, c=c2, track_id=crop.track_id)
                 hits.append(hit)
+        self.timed('hits', t0)
 
         return hits
 
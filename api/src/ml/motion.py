@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+
+MOTION_SIZE = (160, 90)
+MOTION_PIXEL_DIFF = 25  # @NOTE: Per-pixel grayscale difference that counts as change
+MOTION_MAX_SKIP = 50  # @NOTE: Run full inference at least every N frames, even on a static scene
+
+
+# @NOTE: Cheap pre-filter in front of Runner.infer. Compares a downscaled frame against the last frame that was
+#        actually inferred (not the previous one), so slow motion still accumulates until it passes the threshold.
+class MotionGate:
+    def __init__(self, threshold: float, max_skip: int = MOTION_MAX_SKIP):
+        self.threshold = threshold  # @NOTE: Fraction of changed pixels
+        self.max_skip = max_skip
+        self.reference: np.ndarray | None = None
+        self.n_skipped = 0
+
+    def score(self, small: np.ndarray) -> float:
+        diff = cv2.absdiff(small, self.reference)
+        return np.count_nonzero(diff > MOTION_PIXEL_DIFF) / diff.size
+
+    def is_static(self, frame: np.ndarray) -> bool:
+        small = cv2.resize(frame, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self.reference is not None and self.n_skipped < self.max_skip and self.score(small) < self.threshold:
+            self.n_skipped += 1
+            return True
+
+        self.reference = small
+        self.n_skipped = 0
+        return False
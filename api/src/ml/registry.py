@@ -0,0 +1,58 @@
+import threading
+from os import path
+
+import numpy as np
+from ultralytics import YOLO
+
+from src.ml.backends import Backend, detect_backend, load_model
+
+
+def weights_mtime(weights: str) -> float | None:
+    # @NOTE: yolov8n-pose.pt is downloaded on first load, so it may be missing
+    if not path.exists(weights):
+        return None
+    return path.getmtime(weights)
+
+
+class LoadedModel:
+    def __init__(self, weights: str, task: str, model: YOLO, mtime: float | None):
+        self.weights = weights
+        self.task = task
+        self.model = model
+        self.mtime = mtime
+        # @NOTE: Ultralytics predictor is not thread safe
+        self.lock = threading.Lock()
+
+
+# @NOTE: Loads each model once per process, streams only own their tracker state
+class ModelRegistry:
+    def __init__(self, backend: Backend | None = None):
+        self.backend = backend
+        self.models: dict[str, LoadedModel] = {}
+        self.lock = threading.Lock()
+
+    def get(self, weights: str, task: str) -> LoadedModel:
+        with self.lock:
+            if self.backend is None:
+                self.backend = detect_backend()
+
+            loaded = self.models.get(weights)
+            mtime = weights_mtime(weights)
+            if loaded is not None and (mtime is None or loaded.mtime == mtime):
+                return loaded
+
+            print(f'Loading {weights} ({self.backend.value})')
+            model = load_model(weights, task, self.backend)
+            loaded = LoadedModel(weights, task, model, weights_mtime(weights))
+            self.warm_up(loaded)
+            self.models[weights] = loaded
+            return loaded
+
+    @staticmethod
+    def warm_up(loaded: LoadedModel):
+        frame = np.zeros((640, 640, 3), dtype=np.uint8)
+        with loaded.lock:
+            loaded.model.predict(frame, verbose=False)
+
+
+registry = ModelRegistry()
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import Future
+from os import getenv
+
+import numpy as np
+from ultralytics.engine.results import Results
+
+from src.ml.registry import ModelRegistry, registry
+from src.ml.tracker import TRACK_CONF
+
+POSE_BATCH_SIZE = int(getenv('POSE_BATCH_SIZE', '8'))
+POSE_BATCH_WAIT = float(getenv('POSE_BATCH_WAIT_MS', '5')) / 1000
+
+
+# @NOTE: Collects frames from all active streams and runs the model on them as one batch.
+#        Each stream blocks until its result is ready, so there is at most one (the latest) frame per stream
+#        in the queue. Tracking is done by the caller, because tracker state belongs to the stream.
+class BatchScheduler:
+    def __init__(self, weights: str, task: str, models: ModelRegistry = registry,
+                 max_batch: int = POSE_BATCH_SIZE, max_wait: float = POSE_BATCH_WAIT):
+        self.weights = weights
+        self.task = task
+        self.models = models
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending: list[tuple[np.ndarray, Future]] = []
+        self.cond = threading.Condition()
+        self.thread: threading.Thread | None = None
+
+    def predict(self, frame: np.ndarray) -> Results:
+        future = Future()
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=f'scheduler:{self.task}', daemon=True)
+                self.thread.start()
+            self.pending.append((frame, future))
+            self.cond.notify()
+        return future.result()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while len(self.pending) == 0:
+                    self.cond.wait()
+                if len(self.pending) < self.max_batch:
+                    # @NOTE: Give other streams a moment to join the batch
+                    self.cond.wait(self.max_wait)
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+
+            try:
+                loaded = self.models.get(self.weights, self.task)
+                with loaded.lock:
+                    results = loaded.model.predict([frame for frame, _ in batch], conf=TRACK_CONF, verbose=False)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), res in zip(batch, results):
+                future.set_result(res)
@@ -0,0 +1,32 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+TRACKER_CONFIG = 'botsort.yaml'  # @NOTE: Same as YOLO.track() default
+TRACK_CONF = 0.1  # @NOTE: Same as YOLO.track() default, tracker needs low confidence predictions as input
+
+
+# @NOTE: Same as ultralytics.trackers.track.on_predict_postprocess_end, but the tracker is owned by the stream
+#        and not by the model, so that multiple streams can share one model
+class StreamTracker:
+    def __init__(self, frame_rate: int = 30):
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(TRACKER_CONFIG)))
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+    def update(self, res: Results, frame: np.ndarray) -> Results:
+        det = res.boxes.cpu().numpy()
+        if len(det) == 0:
+            return res
+        tracks = self.tracker.update(det, frame)
+        if len(tracks) == 0:
+            return res
+        idx = tracks[:, -1].astype(int)
+        res = res[idx]
+        res.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return res
+
+    def reset(self):
+        self.tracker.reset()
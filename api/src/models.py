@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Enum, JSON, Double, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Enum, JSON, Double, DateTime, Index, LargeBinary
 from sqlalchemy.orm import relationship, Mapped
 
 from src.database import Base
@@ -23,6 +23,14 @@ class VideoSource(Base):
     deleted_at = Column(DateTime, nullable=True)
     name = Column(String)
     t_start = Column(Double)
+    motion_threshold = Column(Double, nullable=True, comment="Fraction of changed pixels below which a frame is skipped, null disables motion gating")
+    is_offline = Column(Boolean, default=False, comment="Process as fast as possible instead of in realtime")
+    analysis_fps = Column(Double, nullable=True, comment="Offline sampling rate, null means every frame_step-th frame")
+    frame_step = Column(Integer, nullable=True, comment="Offline sampling step, null means every frame")
+    t_processed = Column(Double, nullable=True, comment="Seconds of video processed")
+    t_duration = Column(Double, nullable=True, comment="Seconds of video in total")
+    inference_params = Column(String, nullable=True, comment="Model version and parameters of the stored inferences, processing resumes while they match")
+    n_resumes = Column(Integer, nullable=True, comment="Times processing was resumed, keeps track ids of resumed runs apart")
     file_id = Column(Integer, ForeignKey("files.id"))
 
     file = relationship("File")
@@ -38,6 +46,7 @@ class CameraSource(Base):
     url = Column(String, comment="Stripped of basic auth to display in user interface")
     private_url = Column(String)
     mmtx_name = Column(String)
+    motion_threshold = Column(Double, nullable=True, comment="Fraction of changed pixels below which a frame is skipped, null disables motion gating")
 
 
 class Inference(Base):
@@ -48,8 +57,33 @@ class Inference(Base):
 
     source_kind = Column(Enum(SourceKind))
     source_id = Column(Integer)
+    hits_packed = Column(LargeBinary, nullable=True, comment="Hits as packed x, y, w, h, c float32 and track_id int32")
 
-    hits = relationship("InferenceHit", back_populates="inference", cascade="all, delete-orphan")
+    # @NOTE: No foreign key in the database, tables are partitioned (PostgreSQL), so hits are joined on t too
+    hits = relationship("InferenceHit", back_populates="inference", cascade="all, delete-orphan",
+                        primaryjoin="and_(Inference.id == foreign(InferenceHit.inference_id), "
+                                    "Inference.t == foreign(InferenceHit.t))")
+
+    # @NOTE: Cursor queries filter by source and paginate by t
+    __table_args__ = (
+        Index('ix_inferences_source_kind_source_id_t', 'source_kind', 'source_id', 't'),
+    )
+
+
+# @NOTE: Spans of a source that were analyzed, frames without hits are not stored as inferences
+class InferenceCoverage(Base):
+    __tablename__ = "inference_coverages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    t_from = Column(Double)
+    t_to = Column(Double)
+
+    source_kind = Column(Enum(SourceKind))
+    source_id = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_inference_coverages_source_kind_source_id_t_to', 'source_kind', 'source_id', 't_to'),
+    )
 
 
 class InferenceHit(Base):
@@ -63,8 +97,30 @@ class InferenceHit(Base):
     c = Column(Double, comment='Confidence')
     track_id = Column(Integer, nullable=True)
 
-    inference_id = Column(Integer, ForeignKey("inferences.id"))
-    inference = relationship("Inference", back_populates="hits")
+    inference_id = Column(Integer, index=True)
+    inference = relationship("Inference", back_populates="hits",
+                             primaryjoin="and_(Inference.id == foreign(InferenceHit.inference_id), "
+                                         "Inference.t == foreign(InferenceHit.t))")
+
+    # @NOTE: Copied from the inference, tables are partitioned by these (PostgreSQL)
+    t = Column(Double)
+    source_kind = Column(Enum(SourceKind))
 
     file_id = Column(Integer, ForeignKey("files.id"))
     file = relationship("File")
+
+
+# @NOTE: Inferences of a source that are being deleted in background, rows up to these ids are already hidden
+class InferenceWipe(Base):
+    __tablename__ = "inference_wipes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_kind = Column(Enum(SourceKind))
+    source_id = Column(Integer)
+    inference_id_to = Column(Integer, comment="Inferences of the source up to this id are deleted")
+    coverage_id_to = Column(Integer, comment="Coverages of the source up to this id are deleted")
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_inference_wipes_source_kind_source_id', 'source_kind', 'source_id'),
+    )
@@ -0,0 +1,47 @@
+from os import getenv
+
+import numpy as np
+
+from src import schemas
+
+# @NOTE: rows | packed
+#        packed stores hits of a frame on the inference row itself, instead of a row per hit in inference_hits
+INFERENCE_STORAGE = getenv('INFERENCE_STORAGE', 'rows')
+
+# @NOTE: 24 bytes per hit, track_id is -1 when missing. Same layout as struct '<5fi' (used by migrations).
+HIT_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('w', '<f4'), ('h', '<f4'), ('c', '<f4'), ('track_id', '<i4')])
+MAX_HITS_PER_FRAME = 1000
+
+
+def is_packed() -> bool:
+    return INFERENCE_STORAGE == 'packed'
+
+
+def pack_hits(hits: list[schemas.InferenceHitBase]) -> bytes:
+    packed = np.empty(len(hits), dtype=HIT_DTYPE)
+    for i, hit in enumerate(hits):
+        packed[i] = (hit.x, hit.y, hit.w, hit.h, hit.c, -1 if hit.track_id is None else hit.track_id)
+    return packed.tobytes()
+
+
+def packed_hit_id(inference_id: int, index: int) -> int:
+    # @NOTE: Packed hits have no rows, so ids are derived from the inference, negative to never clash with row ids
+    return -(inference_id * MAX_HITS_PER_FRAME + index + 1)
+
+
+def unpack_array(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=HIT_DTYPE)
+
+
+# @NOTE: As dicts in the key order of schemas.InferenceHit
+def unpack_hit_rows(inference_id: int, data: bytes) -> list[dict]:
+    packed = unpack_array(data)
+    hits = []
+    for i, (x, y, w, h, c, track_id) in enumerate(packed.tolist()):
+        hits.append({'x': x, 'y': y, 'w': w, 'h': h, 'c': c, 'track_id': None if track_id == -1 else track_id,
+                     'id': packed_hit_id(inference_id, i)})
+    return hits
+
+
+def unpack_hits(inference_id: int, data: bytes) -> list[schemas.InferenceHit]:
+    return [schemas.InferenceHit(**it) for it in unpack_hit_rows(inference_id, data)]
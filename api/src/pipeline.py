@@ -0,0 +1,339 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple
+
+import cv2
+import numpy as np
+from sqlalchemy.orm import Session
+
+from src import schemas
+from src.cancellation import CancelToken
+from src.metrics import SourceMetrics
+from src.ml.guns import Runner
+from src.ml.motion import MotionGate
+from src.writer import InferenceWriter, WRITER_COPY_BATCH_SIZE, coverage_gap
+
+
+class QueueClosed(Exception):
+    pass
+
+
+# @NOTE: Bounded queue with an explicit overflow policy:
+#        drop_oldest=True always keeps the freshest items and counts what was dropped,
+#        drop_oldest=False blocks the producer instead (for results, which must not be lost)
+class BoundedQueue:
+    def __init__(self, maxsize: int, drop_oldest: bool):
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.n_dropped = 0
+
+    def put(self, item: Any) -> bool:
+        dropped = False
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                if self.drop_oldest:
+                    self.items.popleft()
+                    self.n_dropped += 1
+                    dropped = True
+                else:
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.cond.wait()
+            if self.closed:
+                raise QueueClosed()
+            self.items.append(item)
+            self.cond.notify_all()
+        return dropped
+
+    # @NOTE: Returns None on timeout
+    def get(self, timeout: float | None = None) -> Any:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.cond:
+            while len(self.items) == 0:
+                if self.closed:
+                    raise QueueClosed()
+                if deadline is None:
+                    self.cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self.cond.wait(remaining)
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    # @NOTE: Takes whatever is queued without waiting
+    def drain(self) -> list[Any]:
+        with self.cond:
+            items = list(self.items)
+            self.items.clear()
+            self.cond.notify_all()
+            return items
+
+
+def video_duration(cap: cv2.VideoCapture) -> float | None:
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    n_total = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    if fps > 0 and n_total > 0:
+        return n_total / fps
+    return None
+
+
+# @NOTE: Decoding also stops when the stream breaks off, e.g. when a presigned URL expires, so the stream was only
+#        decoded to the end when the last grabbed frame is within one frame interval of the duration.
+#        Position of a frame is its start, the last frame starts one interval before the end.
+def is_decoded_to_end(t_last: float | None, t_duration: float | None, fps: float) -> bool:
+    if t_last is None or t_duration is None or fps <= 0:
+        return False
+    return t_last + 1 / fps >= t_duration - 1 / fps
+
+
+def is_sampled(n_frame: int, dpt: float, last_dpt: float | None,
+               analysis_fps: float | None, frame_step: int | None) -> bool:
+    if analysis_fps is not None:
+        # @NOTE: Take the first frame of every 1 / analysis_fps interval
+        return last_dpt is None or int(dpt * analysis_fps) != int(last_dpt * analysis_fps)
+    if frame_step is not None:
+        return n_frame % frame_step == 0
+    return True
+
+
+class DecodedFrame(NamedTuple):
+    dpt: float  # @NOTE: Seconds since the start of the stream
+    frame: np.ndarray
+
+
+# @NOTE: Decode -> infer -> write, each stage on its own thread, connected by bounded queues.
+#        Decoder always hands the freshest frame to inference, so a slow model or a slow DB does not
+#        make the stream buffer up, and end-to-end lag stays around one inference time.
+class InferencePipeline:
+    def __init__(
+            self,
+            db: Session,
+            url: str,
+            source_kind: schemas.SourceKind,
+            source_id: int,
+            t_base: float,
+            motion_threshold: float | None = None,
+            pace: bool = False,
+            offline: bool = False,
+            analysis_fps: float | None = None,
+            frame_step: int | None = None,
+            cancel: CancelToken | None = None,
+            on_progress: Callable[[float, float | None], None] | None = None,
+            t_resume: float = 0.0,
+            track_id_offset: int = 0,
+    ):
+        self.db = db
+        self.url = url
+        self.source_kind = source_kind
+        self.source_id = source_id
+        self.t_base = t_base  # @NOTE: Unix seconds of the stream start
+        self.pace = pace  # @NOTE: Do not decode ahead of realtime (for files)
+        # @NOTE: Offline mode processes every sampled frame as fast as possible, so results are reproducible
+        self.offline = offline
+        self.analysis_fps = analysis_fps
+        self.frame_step = frame_step
+        self.cancel = cancel
+        self.on_progress = on_progress
+        self.t_resume = t_resume  # @NOTE: Seconds of the stream already processed, only later frames are processed
+        self.track_id_offset = track_id_offset  # @NOTE: Keeps track ids of a resumed run apart from earlier ones
+
+        self.runner = Runner()
+        self.metrics = SourceMetrics(source_kind, source_id)
+        self.gate = MotionGate(motion_threshold) if motion_threshold is not None else None
+
+        if offline:
+            self.frames = BoundedQueue(8, drop_oldest=False)
+        else:
+            self.frames = BoundedQueue(1, drop_oldest=True)
+        self.results = BoundedQueue(256, drop_oldest=False)
+        self.stopped = threading.Event()
+        self.errors: list[Exception] = []  # @NOTE: Of the stage threads, the first one is raised from run
+
+        self.n_decoded = 0
+        self.n_behind = 0
+        self.n_static = 0
+        self.n_inferred = 0
+        self.n_written = 0
+        self.t_processed = self.t_resume
+        self.t_duration: float | None = None
+        self.fps = 0.0
+        self.t_decoded: float | None = None  # @NOTE: Position of the last grabbed frame
+        self.decoded_to_end = False
+
+    def stop(self):
+        self.stopped.set()
+        self.frames.close()
+        self.results.close()
+
+    # @NOTE: A failed stage stops the others, so that none of them waits on a queue forever
+    def fail(self, e: Exception):
+        self.errors.append(e)
+        self.stop()
+
+    def decode(self):
+        cap = None
+        try:
+            cap = cv2.VideoCapture(self.url)
+            self.t_duration = video_duration(cap)
+            self.fps = cap.get(cv2.CAP_PROP_FPS)
+
+            if self.t_resume > 0:
+                cap.set(cv2.CAP_PROP_POS_MSEC, self.t_resume * 1000)
+            # @NOTE: Realtime is counted from the resume position
+            rt_start = time.time() - self.t_resume
+            last_dpt = None
+            while not self.stopped.is_set():
+                t0 = time.perf_counter()
+                ret = cap.grab()
+                if not ret:
+                    self.decoded_to_end = is_decoded_to_end(self.t_decoded, self.t_duration, self.fps)
+                    break
+                self.metrics.grab_seconds.observe(time.perf_counter() - t0)
+
+                dpt = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                self.t_decoded = dpt
+                if dpt <= self.t_resume and self.t_resume > 0:
+                    continue  # @NOTE: Seeking lands on a keyframe before the position
+                drt = time.time() - rt_start
+
+                if self.offline:
+                    n_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+                    if not is_sampled(n_frame, dpt, last_dpt, self.analysis_fps, self.frame_step):
+                        self.metrics.frames_skipped_sampling.inc()
+                        continue
+                    last_dpt = dpt
+                else:
+                    # @NOTE: Skip frames if we are behind realtime
+                    if dpt < drt:
+                        self.n_behind += 1
+                        self.metrics.frames_skipped_behind.inc()
+                        continue
+                    if self.pace and dpt > drt:
+                        time.sleep(dpt - drt)
+
+                t0 = time.perf_counter()
+                status, frame = cap.retrieve()
+                if not status:
+                    continue
+                self.metrics.retrieve_seconds.observe(time.perf_counter() - t0)
+                self.n_decoded += 1
+                if self.frames.put(DecodedFrame(dpt, frame)):
+                    self.metrics.frames_dropped.inc()
+        except QueueClosed:
+            pass
+        except Exception as e:
+            self.fail(e)
+        finally:
+            if cap is not None:
+                cap.release()
+            self.frames.close()
+
+    def infer(self):
+        hits = []
+        try:
+            while True:
+                item = self.frames.get()
+                # @PERF: Carry forward the last result while the scene is static
+                if self.gate is None or not self.gate.is_static(item.frame):
+                    hits = self.runner.infer(item.frame, item.dpt)
+                    if self.track_id_offset != 0:
+                        for hit in hits:
+                            hit.track_id += self.track_id_offset
+                    timings = self.runner.timings
+                    self.metrics.pose_seconds.observe(timings.get('pose', 0.0))
+                    self.metrics.gun_seconds.observe(
+                        timings.get('crop', 0.0) + timings.get('gun', 0.0) + timings.get('hits', 0.0))
+                    self.metrics.frames_processed.inc()
+                else:
+                    self.n_static += 1
+                    self.metrics.frames_skipped_static.inc()
+                self.metrics.hits.observe(len(hits))
+                inference = schemas.InferenceCreate(t=self.t_base + item.dpt, hits=hits,
+                                                    source_kind=self.source_kind, source_id=self.source_id)
+                self.n_inferred += 1
+                self.results.put(inference)
+        except QueueClosed:
+            pass
+        finally:
+            # @NOTE: Writer still drains what is left in the queue
+            self.frames.close()
+            self.results.close()
+
+    def flush(self, writer: InferenceWriter):
+        t0 = time.perf_counter()
+        try:
+            flushed = writer.flush()
+        except Exception:
+            self.db.rollback()
+            raise
+        if len(flushed) == 0:
+            return
+        self.metrics.db_write_seconds.observe(time.perf_counter() - t0)
+
+        n_written = self.n_written + len(flushed)
+        if n_written // 100 != self.n_written // 100:
+            print(f'Processed {n_written} frames ({self.frames.n_dropped} dropped, '
+                  f'{self.n_behind} behind, {self.n_static} static)')
+        self.n_written = n_written
+        self.t_processed = flushed[-1].t - self.t_base
+
+        if self.on_progress is not None:
+            self.on_progress(self.t_processed, self.t_duration)
+
+    def write(self):
+        if self.offline:
+            writer = InferenceWriter(self.db, batch_size=WRITER_COPY_BATCH_SIZE, use_copy=True,
+                                     max_gap=coverage_gap(self.analysis_fps))
+        else:
+            writer = InferenceWriter(self.db)
+        try:
+            try:
+                while not self.stopped.is_set():
+                    inference = self.results.get(timeout=writer.time_left())
+                    if inference is not None:
+                        writer.add(inference)
+                    if writer.is_due():
+                        self.flush(writer)
+            except QueueClosed:
+                pass
+
+            # @NOTE: Write what is left on stop too, both the batch and what is still queued
+            for inference in self.results.drain():
+                writer.add(inference)
+            self.flush(writer)
+            if self.decoded_to_end:
+                # @NOTE: Whole stream was processed, otherwise the next run resumes from the last written frame
+                self.t_processed = self.t_duration
+            if self.on_progress is not None:
+                self.on_progress(self.t_processed, self.t_duration)
+        except Exception as e:
+            self.fail(e)
+
+    def run(self):
+        # @NOTE: Decoder checks stopped before every frame, so a stop takes effect within one frame
+        if self.cancel is not None:
+            self.cancel.on_cancel(self.stop)
+        decoder = threading.Thread(target=self.decode, name=f'decode:{self.source_kind.value}:{self.source_id}')
+        writer = threading.Thread(target=self.write, name=f'write:{self.source_kind.value}:{self.source_id}')
+        decoder.start()
+        writer.start()
+        try:
+            self.infer()
+        except Exception as e:
+            self.fail(e)
+        decoder.join()
+        writer.join()
+        # @NOTE: So that the job is marked as failed
+        if len(self.errors) > 0:
+            raise self.errors[0]
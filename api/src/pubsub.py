@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from typing import AsyncIterator
+
+from src import schemas
+from src.database import SessionLocal
+from src.encoding import encode_json
+from src.recent import get_inference_rows
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+BACKFILL_PAGE_SIZE = 1000
+KEEPALIVE_INTERVAL = 15.0
+
+
+class Subscription:
+    def __init__(self, key: tuple[schemas.SourceKind, int], loop: asyncio.AbstractEventLoop):
+        self.key = key
+        self.loop = loop
+        # @NOTE: None once the subscriber fell behind
+        self.queue: asyncio.Queue[schemas.InferenceBase | None] = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    # @NOTE: Runs on the event loop. A slow subscriber does not hold back writers: once its queue is full, the queued
+    #        events are dropped and the stream ends with "resync", so that the client backfills from its last event.
+    def put(self, inference: schemas.InferenceBase):
+        if self.overflowed:
+            return
+        if self.queue.full():
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(inference)
+
+
+# @NOTE: In-process fanout of new inferences from writer threads to streaming endpoints,
+#        so that live viewers do not query the database for every poll
+class InferenceHub:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions: dict[tuple[schemas.SourceKind, int], set[Subscription]] = {}
+
+    def subscribe(self, source_kind: schemas.SourceKind, source_id: int) -> Subscription:
+        subscription = Subscription((source_kind, source_id), asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.setdefault(subscription.key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.key)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if len(subscriptions) == 0:
+                del self.subscriptions[subscription.key]
+
+    # @NOTE: Called from writer threads, after the inference is committed
+    def publish(self, inference: schemas.InferenceCreate):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get((inference.source_kind, inference.source_id), ()))
+        if len(subscriptions) == 0:
+            return
+        event = schemas.InferenceBase(t=inference.t, hits=inference.hits)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                pass  # @NOTE: Event loop is closed, the subscriber is gone with it
+
+
+hub = InferenceHub()
+
+
+def format_event(event: str, data: bytes) -> bytes:
+    return b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+
+
+def backfill_page(source_kind: schemas.SourceKind, source_id: int, since_t: float) -> list[dict]:
+    db = SessionLocal()
+    try:
+        return get_inference_rows(db, source_kind, source_id, since_t, BACKFILL_PAGE_SIZE)
+    finally:
+        db.close()
+
+
+# @NOTE: Page by page, so that a long history is not held in memory at once
+async def backfill(source_kind: schemas.SourceKind, source_id: int, since_t: float) -> AsyncIterator[dict]:
+    while True:
+        page = await asyncio.to_thread(backfill_page, source_kind, source_id, since_t)
+        for row in page:
+            yield row
+        if len(page) < BACKFILL_PAGE_SIZE:
+            return
+        since_t = page[-1]['t']
+
+
+# @NOTE: Server-sent events: stored inferences after since_t, then "ready", then new inferences as they are produced.
+#        Events have the shape of schemas.InferenceBase, without ids. "resync" ends the stream when the client fell
+#        behind, it reconnects with since_t of its last event.
+async def inference_events(source_kind: schemas.SourceKind, source_id: int, since_t: float) -> AsyncIterator[bytes]:
+    # @NOTE: Subscribed before the backfill query, so that nothing falls in between
+    subscription = hub.subscribe(source_kind, source_id)
+    try:
+        async for row in backfill(source_kind, source_id, since_t):
+            hits = [{k: v for k, v in hit.items() if k != 'id'} for hit in row['hits']]
+            yield format_event('inference', encode_json({'t': row['t'], 'hits': hits}))
+            since_t = row['t']
+        yield format_event('ready', b'{}')
+
+        while True:
+            try:
+                inference = await asyncio.wait_for(subscription.queue.get(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if inference is None:
+                yield format_event('resync', b'{}')
+                return
+            if inference.t <= since_t:
+                continue  # @NOTE: Already sent with the backfill
+            yield format_event('inference', encode_json(inference.model_dump(mode='json')))
+    finally:
+        hub.unsubscribe(subscription)
+
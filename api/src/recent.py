@@ -0,0 +1,127 @@
+import bisect
+import itertools
+import threading
+import time
+from collections import deque
+from os import getenv
+
+from sqlalchemy.orm import Session
+
+from src import crud, schemas
+from src.metrics import INFERENCE_READS
+
+# @NOTE: Per source. Rows are only kept while both limits hold, 0 disables the buffer.
+RECENT_BUFFER_BYTES = int(getenv('RECENT_BUFFER_BYTES', str(4 * 1024 * 1024)))
+RECENT_BUFFER_AGE = float(getenv('RECENT_BUFFER_AGE_S', '300'))
+
+# @NOTE: Rough size of a row in memory, dicts and floats of CPython
+ROW_BYTES = 400
+HIT_BYTES = 700
+
+
+def row_bytes(row: dict) -> int:
+    return ROW_BYTES + HIT_BYTES * len(row['hits'])
+
+
+# @NOTE: Latest written inferences of one source, in the shape of crud.get_inference_rows.
+#        Complete for t > t_from: every stored inference after it is in the buffer.
+class RecentBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows: deque[dict] = deque()
+        self.ts: deque[float] = deque()
+        self.added_at: deque[float] = deque()
+        self.n_bytes = 0
+        self.t_from: float | None = None
+
+    def reset(self):
+        self.rows.clear()
+        self.ts.clear()
+        self.added_at.clear()
+        self.n_bytes = 0
+        self.t_from = None
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+
+    def evict(self, now: float):
+        while len(self.rows) > 0 and (self.n_bytes > RECENT_BUFFER_BYTES
+                                      or now - self.added_at[0] > RECENT_BUFFER_AGE):
+            row = self.rows.popleft()
+            self.ts.popleft()
+            self.added_at.popleft()
+            self.n_bytes -= row_bytes(row)
+            self.t_from = row['t']
+        if len(self.rows) == 0:
+            # @NOTE: Nothing left to serve, e.g. the source is written by another process by now
+            self.t_from = None
+
+    def extend(self, rows: list[dict]):
+        now = time.monotonic()
+        with self.lock:
+            for row in rows:
+                if len(self.ts) > 0 and row['t'] < self.ts[-1]:
+                    # @NOTE: Out of order, e.g. a video restarted from the beginning, start over
+                    self.reset()
+                if self.t_from is None:
+                    # @NOTE: Older inferences of the source may be stored, so only what comes after the first is known
+                    self.t_from = row['t']
+                self.rows.append(row)
+                self.ts.append(row['t'])
+                self.added_at.append(now)
+                self.n_bytes += row_bytes(row)
+            self.evict(now)
+
+    # @NOTE: None when since_t is before the buffered window
+    def get(self, since_t: float, limit: int) -> list[dict] | None:
+        with self.lock:
+            self.evict(time.monotonic())
+            if self.t_from is None or since_t < self.t_from:
+                return None
+            start = bisect.bisect_right(self.ts, since_t)
+            return list(itertools.islice(self.rows, start, start + limit))
+
+
+# @NOTE: Filled by the writers of this process, so live viewers mostly do not touch the database
+class RecentInferences:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffers: dict[tuple[schemas.SourceKind, int], RecentBuffer] = {}
+
+    def get_buffer(self, source_kind: schemas.SourceKind, source_id: int) -> RecentBuffer:
+        with self.lock:
+            key = (source_kind, source_id)
+            if key not in self.buffers:
+                self.buffers[key] = RecentBuffer()
+            return self.buffers[key]
+
+    def extend(self, source_kind: schemas.SourceKind, source_id: int, rows: list[dict]):
+        if RECENT_BUFFER_BYTES <= 0 or len(rows) == 0:
+            return
+        self.get_buffer(source_kind, source_id).extend(rows)
+
+    # @NOTE: After the inferences of the source are wiped
+    def clear(self, source_kind: schemas.SourceKind, source_id: int):
+        self.get_buffer(source_kind, source_id).clear()
+
+    def get(self, source_kind: schemas.SourceKind, source_id: int, since_t: float, limit: int) -> list[dict] | None:
+        with self.lock:
+            buffer = self.buffers.get((source_kind, source_id))
+        if buffer is None:
+            return None
+        return buffer.get(since_t, limit)
+
+
+recent = RecentInferences()
+
+
+# @NOTE: Rows are shared with the buffer and must not be modified
+def get_inference_rows(db: Session, source_kind: schemas.SourceKind, source_id: int, since_t: float,
+                       limit: int) -> list[dict]:
+    rows = recent.get(source_kind, source_id, since_t, limit)
+    if rows is not None:
+        INFERENCE_READS.labels(source_kind=source_kind.value, served_from='memory').inc()
+        return rows
+    INFERENCE_READS.labels(source_kind=source_kind.value, served_from='db').inc()
+    return crud.get_inference_rows(db, source_kind, source_id, since_t, limit)
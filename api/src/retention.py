@@ -0,0 +1,158 @@
+import datetime
+import threading
+import time
+from os import getenv
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src import crud, schemas
+from src.database import SessionLocal
+
+# @NOTE: Camera inferences older than this are dropped, 0 keeps them forever.
+#        Video inferences are kept while the source exists, t of a video is its recording time.
+INFERENCE_RETENTION_DAYS = float(getenv('INFERENCE_RETENTION_DAYS', '0'))
+RETENTION_INTERVAL = float(getenv('RETENTION_INTERVAL_S', '3600'))
+WIPE_BATCH_SIZE = int(getenv('WIPE_BATCH_SIZE', '5000'))
+WIPE_BATCH_PAUSE = 0.05  # @NOTE: Seconds between batches, so that wipes do not starve capture writes
+PARTITION_DAYS_AHEAD = 7
+DAY = 24 * 60 * 60
+
+PARTITIONED_TABLES = ['inferences', 'inference_hits']
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != 'postgresql':
+        return False
+    return db.execute(text('''
+        SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'inferences_camera'
+    ''')).scalar() is not None
+
+
+def partition_suffix(day: int) -> str:
+    return datetime.datetime.fromtimestamp(day, datetime.timezone.utc).strftime('%Y%m%d')
+
+
+def get_camera_partitions(db: Session, table: str) -> dict[int, str]:
+    # @NOTE: Day (unix seconds) -> partition name, for daily partitions of table_camera
+    rows = db.execute(text('''
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :parent
+    '''), dict(parent=f'{table}_camera')).scalars().all()
+    partitions = {}
+    prefix = f'{table}_camera_'
+    for name in rows:
+        suffix = name[len(prefix):]
+        day = datetime.datetime.strptime(suffix, '%Y%m%d').replace(tzinfo=datetime.timezone.utc)
+        partitions[int(day.timestamp())] = name
+    return partitions
+
+
+# @NOTE: There is no default partition, so camera rows need the partition of their day to exist beforehand
+def ensure_partitions(db: Session, now: float):
+    today = int(now) // DAY * DAY
+    for table in PARTITIONED_TABLES:
+        partitions = get_camera_partitions(db, table)
+        for day in range(today, today + (PARTITION_DAYS_AHEAD + 1) * DAY, DAY):
+            if day in partitions:
+                continue
+            db.execute(text(f'''
+                CREATE TABLE IF NOT EXISTS {table}_camera_{partition_suffix(day)} PARTITION OF {table}_camera
+                FOR VALUES FROM ({day}) TO ({day + DAY})
+            '''))
+    db.commit()
+
+
+# @PERF: Detached concurrently, so that readers and writers of the other days are not blocked by an ACCESS EXCLUSIVE
+#        lock of the parent, then dropped on their own
+def drop_expired_partitions(db: Session, t_before: float) -> int:
+    expired = [(table, name) for table in PARTITIONED_TABLES
+               for day, name in get_camera_partitions(db, table).items() if day + DAY <= t_before]
+    pending = set(db.execute(text('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhdetachpending'))
+                  .scalars().all())
+    db.commit()
+    # @NOTE: Not in a transaction, Postgres refuses to detach concurrently in one
+    with db.get_bind().connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table, name in expired:
+            # @NOTE: An interrupted concurrent detach leaves the partition pending, it can only be finalized
+            mode = 'FINALIZE' if name in pending else 'CONCURRENTLY'
+            conn.execute(text(f'ALTER TABLE {table}_camera DETACH PARTITION {name} {mode}'))
+            conn.execute(text(f'DROP TABLE {name}'))
+    return len(expired)
+
+
+# @NOTE: Background thread for everything that deletes inferences: per-source wipes and retention
+class InferenceCleaner:
+    def __init__(self):
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.t_last_retention = 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='inference-cleaner', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    # @NOTE: Called after a wipe is recorded, so that it starts right away
+    def notify(self):
+        self.wake.set()
+
+    def run_wipes(self, db: Session):
+        for db_wipe in crud.get_inference_wipes(db):
+            n_deleted = 0
+            while not self.stopped.is_set():
+                n = crud.wipe_inferences_batch(db, db_wipe, WIPE_BATCH_SIZE)
+                n_deleted += n
+                if n == 0:
+                    break
+                time.sleep(WIPE_BATCH_PAUSE)
+            print(f'Wiped {n_deleted} inferences of {db_wipe.source_kind.value} source {db_wipe.source_id}')
+
+    def run_retention(self, db: Session):
+        now = time.time()
+        partitioned = is_partitioned(db)
+        if partitioned:
+            ensure_partitions(db, now)
+        if INFERENCE_RETENTION_DAYS <= 0:
+            return
+
+        t_before = now - INFERENCE_RETENTION_DAYS * DAY
+        if partitioned:
+            # @PERF: Whole days go at once, no row by row delete and no bloat
+            n_dropped = drop_expired_partitions(db, t_before)
+            if n_dropped > 0:
+                print(f'Dropped {n_dropped} expired inference partitions')
+        else:
+            while not self.stopped.is_set():
+                if crud.expire_inferences_batch(db, schemas.SourceKind.Camera, t_before, WIPE_BATCH_SIZE) == 0:
+                    break
+                time.sleep(WIPE_BATCH_PAUSE)
+        crud.expire_inference_coverages(db, schemas.SourceKind.Camera, t_before)
+
+    def run(self):
+        while not self.stopped.is_set():
+            db = SessionLocal()
+            try:
+                # @NOTE: Retention first, on start it creates the partitions of the coming days before any wipe
+                if time.time() - self.t_last_retention >= RETENTION_INTERVAL:
+                    self.run_retention(db)
+                    self.t_last_retention = time.time()
+                self.run_wipes(db)
+            except Exception as e:
+                # @NOTE: Try again on the next round, the cleaner must not die with the database away
+                print(f'Inference cleanup failed: {e}')
+                db.rollback()
+            finally:
+                db.close()
+            self.wake.wait(RETENTION_INTERVAL)
+            self.wake.clear()
+
+
+cleaner = InferenceCleaner()
@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 
-from pydantic import BaseModel, json
+from pydantic import BaseModel, Field, json
 
 
 class Result(BaseModel):
@@ -37,6 +37,10 @@ class FileCreateResponse(BaseModel):
 class VideoSourceBase(BaseModel):
     name: str
     is_active: bool
+    motion_threshold: float | None = None  # @DOC: fraction of changed pixels, null disables motion gating
+    is_offline: bool = False  # @DOC: process as fast as possible instead of in realtime
+    analysis_fps: float | None = Field(None, gt=0)  # @DOC: offline only, frames per second of video to analyze
+    frame_step: int | None = Field(None, gt=0)  # @DOC: offline only, every n-th frame if analysis_fps is not set
 
 
 class VideoSourceCreate(VideoSourceBase):
@@ -46,6 +50,7 @@ class VideoSourceCreate(VideoSourceBase):
 class VideoSourceUpdate(VideoSourceBase):
     name: str = None
     is_active: bool = None
+    is_offline: bool = None
     pass
 
 
@@ -54,6 +59,8 @@ class VideoSource(VideoSourceBase):
     deleted_at: datetime | None
     file: File
     t_start: float  # @DOC: unix seconds
+    t_processed: float | None  # @DOC: seconds of video processed
+    t_duration: float | None  # @DOC: seconds of video in total
 
     class Config:
         from_attributes = True
@@ -62,6 +69,7 @@ class VideoSource(VideoSourceBase):
 class CameraSourceBase(BaseModel):
     name: str
     is_active: bool
+    motion_threshold: float | None = None  # @DOC: fraction of changed pixels, null disables motion gating
 
 
 class CameraSourceCreate(CameraSourceBase):
@@ -138,3 +146,43 @@ class Inference(InferenceBase):
 
     class Config:
         from_attributes = True
+
+
+class InferenceCoverage(BaseModel):
+    t_from: float
+    t_to: float
+
+    class Config:
+        from_attributes = True
+
+
+class TimelineBucket(BaseModel):
+    t_from: float
+    t_to: float
+    n_inferences: int
+    n_hits: int
+    max_c: float | None  # @DOC: null when there are no hits
+    track_ids: list[int]
+
+
+class JobState(Enum):
+    Queued = 'Queued'  # @DOC: waiting for compute budget or for the previous job of the source to stop
+    Running = 'Running'
+    Stopping = 'Stopping'
+    Done = 'Done'
+    Cancelled = 'Cancelled'  # @DOC: stopped or replaced before it was done
+    Failed = 'Failed'
+
+
+class Job(BaseModel):
+    source_kind: SourceKind
+    source_id: int
+    state: JobState
+    cost: float  # @DOC: compute budget units, see JOB_COMPUTE_BUDGET
+    created_at: float  # @DOC: unix seconds
+    started_at: float | None
+    finished_at: float | None
+    error: str | None
+
+    class Config:
+        from_attributes = True
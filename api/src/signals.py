@@ -0,0 +1,88 @@
+import json
+import select
+import threading
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src import schemas
+from src.database import engine
+from src.jobs import jobs
+from src.recent import recent
+
+# @NOTE: Changes of sources for other API processes, over PostgreSQL LISTEN/NOTIFY.
+#        A process that gets a change for a source stops its own job of the source, the process that made
+#        the change runs the replacement if there is one. So that, like within one process, a change of a
+#        source always ends up with a single runner.
+CHANNEL = 'source_changes'
+ORIGIN = uuid.uuid4().hex  # @NOTE: This process, its own changes are applied directly
+LISTEN_TIMEOUT = 5.0
+RECONNECT_DELAY = 1.0
+
+
+def is_supported() -> bool:
+    return engine.dialect.name == 'postgresql'
+
+
+def notify_source_change(db: Session, source_kind: schemas.SourceKind, source_id: int):
+    if db.get_bind().dialect.name != 'postgresql':
+        return
+    payload = json.dumps(dict(source_kind=source_kind.value, source_id=source_id, origin=ORIGIN))
+    db.execute(text('SELECT pg_notify(:channel, :payload)'), dict(channel=CHANNEL, payload=payload))
+    db.commit()
+
+
+def apply_source_change(payload: str):
+    change = json.loads(payload)
+    if change['origin'] == ORIGIN:
+        return
+    source_kind = schemas.SourceKind(change['source_kind'])
+    jobs.stop(source_kind, change['source_id'])
+    # @NOTE: Inferences of the source are written elsewhere from now on, the buffer would go stale
+    recent.clear(source_kind, change['source_id'])
+
+
+class SourceListener:
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def start(self):
+        if not is_supported():
+            return
+        self.thread = threading.Thread(target=self.run, name='source-listener', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def listen(self):
+        # @NOTE: Own connection, kept out of the pool, since it stays in LISTEN and autocommit
+        connection = engine.raw_connection()
+        connection.detach()
+        try:
+            conn = connection.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            while not self.stopped.is_set():
+                if select.select([conn], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    apply_source_change(conn.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception as e:
+                # @NOTE: Changes made while reconnecting are missed, the database may just be restarting
+                print(f'Source listener failed: {e}')
+                self.stopped.wait(RECONNECT_DELAY)
+
+
+listener = SourceListener()
@@ -0,0 +1,95 @@
+import time
+from os import getenv
+
+from sqlalchemy.orm import Session
+
+from src import crud, schemas
+from src.pubsub import hub
+from src.recent import recent
+
+WRITER_BATCH_SIZE = int(getenv('WRITER_BATCH_SIZE', '100'))
+WRITER_COPY_BATCH_SIZE = int(getenv('WRITER_COPY_BATCH_SIZE', '5000'))
+WRITER_MAX_DELAY = float(getenv('WRITER_MAX_DELAY_MS', '500')) / 1000
+# @NOTE: By default frames without hits are only recorded as analyzed spans in inference_coverages
+STORE_EMPTY_INFERENCES = getenv('STORE_EMPTY_INFERENCES', 'False').lower() in ('true', '1', 't', 'yes', 'y')
+COVERAGE_MAX_GAP = float(getenv('COVERAGE_MAX_GAP', '2.0'))
+
+
+def coverage_gap(analysis_fps: float | None) -> float:
+    # @NOTE: Sparse sampling should not break coverage into a span per frame
+    if analysis_fps is not None and analysis_fps > 0:
+        return max(COVERAGE_MAX_GAP, 2 / analysis_fps)
+    return COVERAGE_MAX_GAP
+
+
+# @NOTE: Contiguous span of analyzed frames, id is None until it is saved
+class Coverage:
+    def __init__(self, source_kind: schemas.SourceKind, source_id: int, t: float):
+        self.id: int | None = None
+        self.source_kind = source_kind
+        self.source_id = source_id
+        self.t_from = t
+        self.t_to = t
+
+
+# @NOTE: Accumulates inferences and writes them with one multi-row insert per flush,
+#        instead of a transaction per frame. Nothing stays buffered for longer than max_delay.
+class InferenceWriter:
+    def __init__(self, db: Session, batch_size: int = WRITER_BATCH_SIZE, max_delay: float = WRITER_MAX_DELAY,
+                 use_copy: bool = False, max_gap: float = COVERAGE_MAX_GAP):
+        self.db = db
+        self.use_copy = use_copy  # @NOTE: COPY FROM STDIN for high-throughput ingestion (e.g. archive replay)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_gap = max_gap  # @NOTE: Longer pauses between analyzed frames start a new coverage span
+        self.buffer: list[schemas.InferenceCreate] = []
+        self.t_first = 0.0
+        self.coverages: list[Coverage] = []  # @NOTE: Unsaved changes, the last one is still open
+
+    def time_left(self) -> float | None:
+        if len(self.buffer) == 0:
+            return None
+        return max(0.0, self.t_first + self.max_delay - time.monotonic())
+
+    def is_due(self) -> bool:
+        if len(self.buffer) == 0:
+            return False
+        return len(self.buffer) >= self.batch_size or time.monotonic() - self.t_first >= self.max_delay
+
+    def add(self, inference: schemas.InferenceCreate):
+        if len(self.buffer) == 0:
+            self.t_first = time.monotonic()
+        self.buffer.append(inference)
+
+        coverage = self.coverages[-1] if len(self.coverages) > 0 else None
+        if coverage is None or inference.t - coverage.t_to > self.max_gap:
+            self.coverages.append(Coverage(inference.source_kind, inference.source_id, inference.t))
+        else:
+            coverage.t_to = max(coverage.t_to, inference.t)
+
+    # @NOTE: Returns all flushed frames, including those that were only recorded as coverage
+    def flush(self) -> list[schemas.InferenceCreate]:
+        if len(self.buffer) == 0:
+            return []
+        flushed = self.buffer
+        self.buffer = []
+
+        for coverage in self.coverages:
+            coverage.id = crud.save_inference_coverage(self.db, coverage.source_kind, coverage.source_id,
+                                                       coverage.id, coverage.t_from, coverage.t_to)
+        # @NOTE: Keep the open span, so that the next flush extends it instead of inserting a new one
+        self.coverages = self.coverages[-1:]
+
+        inferences = flushed if STORE_EMPTY_INFERENCES else [it for it in flushed if len(it.hits) > 0]
+        if len(inferences) == 0:
+            self.db.commit()
+            return flushed
+        if self.use_copy:
+            rows = crud.copy_inferences(self.db, inferences)
+        else:
+            rows = crud.create_inferences(self.db, inferences)
+        recent.extend(inferences[0].source_kind, inferences[0].source_id, rows)
+        # @NOTE: Only once committed, so that a new subscriber finds everything it missed with the backfill query
+        for inference in inferences:
+            hub.publish(inference)
+        return flushed
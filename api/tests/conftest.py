@@ -0,0 +1,4 @@
+from os import environ
+
+# @NOTE: Requests in tests are rejected before they reach the database, an in-memory one is enough to import the app
+environ.setdefault('DATABASE_URL', 'sqlite://')
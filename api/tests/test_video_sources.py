@@ -0,0 +1,20 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src.main import app, get_s3_client
+
+app.dependency_overrides[get_s3_client] = lambda: None
+client = TestClient(app)
+
+
+@pytest.mark.parametrize('params', [
+    dict(frame_step=0),
+    dict(frame_step=-1),
+    dict(analysis_fps=0),
+    dict(analysis_fps=-0.5),
+])
+def test_sampling_params_must_be_positive(params: dict):
+    response = client.post('/v1/video-sources', json=dict(name='video', is_active=True, file_id=1, **params))
+    assert response.status_code == 422
+    response = client.patch('/v1/video-sources/1', json=params)
+    assert response.status_code == 422
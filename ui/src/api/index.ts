@@ -22,3 +22,8 @@ export function makeHlsHref(source: GunsAPI.CameraSource): string {
 export function makeS3Href(source: GunsAPI.VideoSource): string {
   return `/s3/${source.file.s3_bucket}/${source.file.s3_key}`;
 }
+
+// @NOTE: Server-sent events, see useInferenceStream
+export function makeInferencesStreamHref(kind: 'video' | 'camera', sourceId: number, sinceT: number): string {
+  return `/api/guns/v1/${kind}-sources/${sourceId}/inferences/stream?since_t=${sinceT}`;
+}
@@ -2,6 +2,7 @@ export namespace GunsAPI {
   export interface CameraSource {
     name: string;
     is_active: boolean;
+    motion_threshold?: number | null;
     id: number;
     deleted_at: string | null;
     url: string;
@@ -10,11 +11,13 @@ export namespace GunsAPI {
   export interface CameraSourceCreate {
     name: string;
     is_active: boolean;
+    motion_threshold?: number | null;
     private_url: string;
   }
   export interface CameraSourceUpdate {
     name?: string;
     is_active?: boolean;
+    motion_threshold?: number | null;
   }
   export interface File {
     name: string;
@@ -39,6 +42,10 @@ export namespace GunsAPI {
     hits: GunsAPI.InferenceHit[];
     id: number;
   }
+  export interface InferenceCoverage {
+    t_from: number;
+    t_to: number;
+  }
   export interface InferenceHit {
     x: number;
     y: number;
@@ -48,9 +55,29 @@ export namespace GunsAPI {
     track_id: number | null;
     id: number;
   }
+  export interface Job {
+    source_kind: GunsAPI.SourceKind;
+    source_id: number;
+    state: GunsAPI.JobState;
+    cost: number;
+    created_at: number;
+    started_at: number | null;
+    finished_at: number | null;
+    error: string | null;
+  }
+  export type JobState = 'Queued' | 'Running' | 'Stopping' | 'Done' | 'Cancelled' | 'Failed';
   export interface Result {
     ok: boolean;
   }
+  export type SourceKind = 'Video' | 'Camera';
+  export interface TimelineBucket {
+    t_from: number;
+    t_to: number;
+    n_inferences: number;
+    n_hits: number;
+    max_c: number | null;
+    track_ids: number[];
+  }
   export interface ValidationError {
     loc: (string | number)[];
     msg: string;
@@ -59,25 +86,44 @@ export namespace GunsAPI {
   export interface VideoSource {
     name: string;
     is_active: boolean;
+    motion_threshold?: number | null;
+    is_offline?: boolean;
+    analysis_fps?: number | null;
+    frame_step?: number | null;
     id: number;
     deleted_at: string | null;
     file: GunsAPI.File;
     t_start: number;
+    t_processed: number | null;
+    t_duration: number | null;
   }
   export interface VideoSourceCreate {
     name: string;
     is_active: boolean;
+    motion_threshold?: number | null;
+    is_offline?: boolean;
+    analysis_fps?: number | null;
+    frame_step?: number | null;
     file_id: number;
   }
   export interface VideoSourceUpdate {
     name?: string;
     is_active?: boolean;
+    motion_threshold?: number | null;
+    is_offline?: boolean;
+    analysis_fps?: number | null;
+    frame_step?: number | null;
   }
 }
 
 export interface GunsAPI {
   version: '1';
   routes: {
+    '/v1/jobs': {
+      GET: {
+        response: GunsAPI.Job[];
+      };
+    };
     '/v1/files': {
       POST: {
         body: GunsAPI.FileCreate;
@@ -113,6 +159,9 @@ export interface GunsAPI {
         params: {
           source_id: number;
         };
+        query?: {
+          full?: boolean;
+        };
         response: GunsAPI.VideoSource;
       };
     };
@@ -128,6 +177,39 @@ export interface GunsAPI {
         response: GunsAPI.Inference[];
       };
     };
+    '/v1/video-sources/{source_id}/timeline': {
+      GET: {
+        params: {
+          source_id: number;
+        };
+        query: {
+          t_from: number;
+          t_to: number;
+          bucket?: number;
+          min_c?: number;
+        };
+        response: GunsAPI.TimelineBucket[];
+      };
+    };
+    '/v1/video-sources/{source_id}/job': {
+      GET: {
+        params: {
+          source_id: number;
+        };
+        response: GunsAPI.Job;
+      };
+    };
+    '/v1/video-sources/{source_id}/coverage': {
+      GET: {
+        params: {
+          source_id: number;
+        };
+        query?: {
+          since_t?: number;
+        };
+        response: GunsAPI.InferenceCoverage[];
+      };
+    };
     '/v1/camera-sources': {
       GET: {
         response: GunsAPI.CameraSource[];
@@ -172,5 +254,38 @@ export interface GunsAPI {
         response: GunsAPI.Inference[];
       };
     };
+    '/v1/camera-sources/{source_id}/timeline': {
+      GET: {
+        params: {
+          source_id: number;
+        };
+        query: {
+          t_from: number;
+          t_to: number;
+          bucket?: number;
+          min_c?: number;
+        };
+        response: GunsAPI.TimelineBucket[];
+      };
+    };
+    '/v1/camera-sources/{source_id}/job': {
+      GET: {
+        params: {
+          source_id: number;
+        };
+        response: GunsAPI.Job;
+      };
+    };
+    '/v1/camera-sources/{source_id}/coverage': {
+      GET: {
+        params: {
+          source_id: number;
+        };
+        query?: {
+          since_t?: number;
+        };
+        response: GunsAPI.InferenceCoverage[];
+      };
+    };
   };
 }
@@ -0,0 +1,73 @@
+import React from 'react';
+import { GunsAPI } from '../generated/GunsAPI';
+import { makeInferencesStreamHref } from '../api';
+
+const FLUSH_INTERVAL = 100; // @DOC: Milliseconds, events are applied to the state in batches
+const RECONNECT_DELAY = 1000; // @DOC: Milliseconds
+
+// @NOTE: Pushed before they are stored, so there are no ids
+export type StreamedInferenceHit = Omit<GunsAPI.InferenceHit, 'id'>;
+export interface StreamedInference {
+  t: number;
+  hits: StreamedInferenceHit[];
+}
+
+// @NOTE: Inferences of a source, stored ones first, then new ones as they are produced.
+//        Null until the stored ones are loaded. Sorted by t.
+export function useInferenceStream(kind: 'video' | 'camera', sourceId: number): StreamedInference[] | null {
+  const [inferences, setInferences] = React.useState<StreamedInference[] | null>(null);
+
+  React.useEffect(() => {
+    let stop = false;
+    let source: EventSource | null = null;
+    let reconnectTid: ReturnType<typeof setTimeout> | undefined;
+    let ready = false;
+    let lastT = 0;
+    let pending: StreamedInference[] = [];
+
+    const flush = () => {
+      if (!ready || pending.length === 0) return;
+      const batch = pending;
+      pending = [];
+      setInferences((prev) => (prev ?? []).concat(batch));
+    };
+    const flushTid = setInterval(flush, FLUSH_INTERVAL);
+
+    const connect = () => {
+      if (stop) return;
+      // @NOTE: Resumes after the last received inference, instead of replaying everything
+      source = new EventSource(makeInferencesStreamHref(kind, sourceId, lastT));
+      source.addEventListener('inference', (ev) => {
+        const inference: StreamedInference = JSON.parse((ev as MessageEvent).data);
+        if (inference.t <= lastT) return;
+        lastT = inference.t;
+        pending.push(inference);
+      });
+      source.addEventListener('ready', () => {
+        ready = true;
+        flush();
+        setInferences((prev) => prev ?? []);
+      });
+      // @NOTE: Fell behind the live events, the server ended the stream, backfill the rest from lastT
+      source.addEventListener('resync', () => {
+        source?.close();
+        connect();
+      });
+      // @NOTE: Native reconnect would repeat the initial since_t
+      source.onerror = () => {
+        source?.close();
+        reconnectTid = setTimeout(connect, RECONNECT_DELAY);
+      };
+    };
+    connect();
+
+    return () => {
+      stop = true;
+      source?.close();
+      clearTimeout(reconnectTid);
+      clearInterval(flushTid);
+    };
+  }, [kind, sourceId]);
+
+  return inferences;
+}
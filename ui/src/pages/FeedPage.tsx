@@ -1,15 +1,18 @@
 import { useSearchParams } from 'react-router-dom';
-import { useInfiniteQuery } from 'react-query';
+import { useQuery } from 'react-query';
 import { makeHlsHref, makeS3Href, taxiosGuns } from '../api';
 import React from 'react';
 import { SourceRow, SourceRowKind, useSources } from '../lib/SourceRow';
 import { SelectChangeEvent } from '@mui/material/Select/SelectInput';
 import { Box, CircularProgress, FormControl, InputLabel, MenuItem, Paper, Select } from '@mui/material';
 import { GunsAPI } from '../generated/GunsAPI';
-import { max } from 'lodash';
 import Hls from 'hls.js';
 import { minConfidenceAtom } from '../state';
 import { useAtom } from 'jotai';
+import { StreamedInference, useInferenceStream } from '../lib/useInferenceStream';
+
+const TIMELINE_BUCKET = 5; // @DOC: Seconds per timeline bucket
+const CAMERA_TIMELINE_HISTORY = 60 * 60; // @DOC: Seconds of camera history on the timeline
 
 export const FeedPage: React.FC = () => {
   const sources = useSources();
@@ -99,36 +102,34 @@ const VideoSourceDisplay: React.FC<VideoSourceDisplayProps> = (props) => {
 
   const videoRef = React.useRef<HTMLVideoElement | null>(null);
 
-  const inferences = useInfiniteQuery(
-    ['inferences/video', source.id],
-    async ({ pageParam = 0 }) => {
-      const inferences = await taxiosGuns.$get('/v1/video-sources/{source_id}/inferences', {
+  // @PERF: Pushed by the server as they are produced, no polling
+  const inferences = useInferenceStream('video', source.id);
+
+  const coverage = useQuery(
+    ['coverage/video', source.id],
+    async () => {
+      return await taxiosGuns.$get('/v1/video-sources/{source_id}/coverage', {
         params: { source_id: source.id },
-        query: { since_t: pageParam },
       });
-      inferences.sort((a, b) => a.t - b.t);
-      return inferences;
-    },
-    {
-      getNextPageParam: (lastPage) => {
-        return max(lastPage.map((it) => it.t));
-      },
     },
+    { refetchInterval: 1000 },
   );
 
-  // @NOTE: Native refetchInterval when used with useInfiniteQuery
-  //        just refetches all pages instead of fetching the next one,
-  //        so we have to do it manually
-  React.useEffect(() => {
-    const pages = inferences.data;
-    if (!pages) return;
-    const tid = setTimeout(() => {
-      inferences.fetchNextPage();
-    }, 500);
-    return () => {
-      clearTimeout(tid);
-    };
-  }, [inferences.data, inferences.fetchNextPage]);
+  // @PERF: Timeline is aggregated by the server, one small response regardless of video length
+  const timeline = useQuery(
+    ['timeline/video', source.id],
+    async () => {
+      return await taxiosGuns.$get('/v1/video-sources/{source_id}/timeline', {
+        params: { source_id: source.id },
+        query: {
+          t_from: source.t_start,
+          t_to: source.t_start + (source.t_duration ?? 24 * 60 * 60),
+          bucket: TIMELINE_BUCKET,
+        },
+      });
+    },
+    { refetchInterval: 1000 },
+  );
 
   return (
     <Box sx={{ my: 1, display: 'flex', flexGrow: 1 }}>
@@ -146,15 +147,20 @@ const VideoSourceDisplay: React.FC<VideoSourceDisplayProps> = (props) => {
             height="100%"
             src={makeS3Href(source)}
           />
-          {inferences.data && (
+          {inferences && (
             <Box sx={{ position: 'absolute', top: 0, left: 0, bottom: 0, right: 0, pointerEvents: 'none' }}>
-              <Overlay videoRef={videoRef} inferences={inferences.data.pages.flat()} tKnownStart={source.t_start} />
+              <Overlay videoRef={videoRef} inferences={inferences} tKnownStart={source.t_start} />
             </Box>
           )}
         </Box>
         <Box sx={{ flexGrow: 0, flexShrink: 0, height: 10, mb: 1 }}>
-          {inferences.data && (
-            <Timeline videoRef={videoRef} inferences={inferences.data.pages.flat()} tKnownStart={source.t_start} />
+          {inferences && (
+            <Timeline
+              videoRef={videoRef}
+              buckets={timeline.data ?? []}
+              coverage={coverage.data ?? []}
+              tKnownStart={source.t_start}
+            />
           )}
         </Box>
       </Paper>
@@ -193,36 +199,31 @@ const CameraSourceDisplay: React.FC<CameraSourceDisplayProps> = (props) => {
     };
   }, [source]);
 
-  const inferences = useInfiniteQuery(
-    ['inferences/camera', source.id],
-    async ({ pageParam = 0 }) => {
-      const inferences = await taxiosGuns.$get('/v1/camera-sources/{source_id}/inferences', {
+  const inferences = useInferenceStream('camera', source.id);
+
+  const coverage = useQuery(
+    ['coverage/camera', source.id],
+    async () => {
+      return await taxiosGuns.$get('/v1/camera-sources/{source_id}/coverage', {
         params: { source_id: source.id },
-        query: { since_t: pageParam },
       });
-      inferences.sort((a, b) => a.t - b.t);
-      return inferences;
-    },
-    {
-      getNextPageParam: (_lastPage, pages) => {
-        return max(pages.flat().map((it) => it.t));
-      },
     },
+    { refetchInterval: 1000 },
   );
 
-  // @NOTE: Native refetchInterval when used with useInfiniteQuery
-  //        just refetches all pages instead of fetching the next one,
-  //        so we have to do it manually
-  React.useEffect(() => {
-    const pages = inferences.data;
-    if (!pages) return;
-    const tid = setTimeout(() => {
-      inferences.fetchNextPage();
-    }, 1000);
-    return () => {
-      clearTimeout(tid);
-    };
-  }, [inferences.data, inferences.fetchNextPage]);
+  const [timelineFrom] = React.useState(
+    () => Math.floor((Date.now() / 1000 - CAMERA_TIMELINE_HISTORY) / TIMELINE_BUCKET) * TIMELINE_BUCKET,
+  );
+  const timeline = useQuery(
+    ['timeline/camera', source.id, timelineFrom],
+    async () => {
+      return await taxiosGuns.$get('/v1/camera-sources/{source_id}/timeline', {
+        params: { source_id: source.id },
+        query: { t_from: timelineFrom, t_to: timelineFrom + 24 * 60 * 60, bucket: TIMELINE_BUCKET },
+      });
+    },
+    { refetchInterval: 1000 },
+  );
 
   return (
     <Box sx={{ my: 1, display: 'flex', flexGrow: 1 }}>
@@ -240,14 +241,14 @@ const CameraSourceDisplay: React.FC<CameraSourceDisplayProps> = (props) => {
             height="100%"
             src={makeHlsHref(source)}
           />
-          {inferences.data && (
+          {inferences && (
             <Box sx={{ position: 'absolute', top: 0, left: 0, bottom: 0, right: 0, pointerEvents: 'none' }}>
-              <Overlay videoRef={videoRef} inferences={inferences.data.pages.flat()} />
+              <Overlay videoRef={videoRef} inferences={inferences} />
             </Box>
           )}
         </Box>
         <Box sx={{ flexGrow: 0, flexShrink: 0, height: 10, mb: 1 }}>
-          {inferences.data && <Timeline videoRef={videoRef} inferences={inferences.data.pages.flat()} />}
+          <Timeline videoRef={videoRef} buckets={timeline.data ?? []} coverage={coverage.data ?? []} />
         </Box>
       </Paper>
       <Paper sx={{ mr: 1, ml: 1, p: 1, width: 400, flexGrow: 0, flexShrink: 0, display: 'none' }}>
@@ -258,13 +259,14 @@ const CameraSourceDisplay: React.FC<CameraSourceDisplayProps> = (props) => {
 };
 
 interface TimelineProps {
-  inferences: GunsAPI.Inference[]; // @DOC: Have to be sorted
+  buckets: GunsAPI.TimelineBucket[]; // @DOC: Have to be sorted, only buckets with inferences
+  coverage: GunsAPI.InferenceCoverage[]; // @DOC: Have to be sorted, spans analyzed without hits have no inferences
   videoRef: React.MutableRefObject<HTMLVideoElement | null>;
   tKnownStart?: number;
 }
 
 const Timeline: React.FC<TimelineProps> = (props) => {
-  const { inferences, videoRef, tKnownStart } = props;
+  const { buckets, coverage, videoRef, tKnownStart } = props;
   const ref = React.useRef<HTMLCanvasElement | null>(null);
 
   const [minConfidence] = useAtom(minConfidenceAtom);
@@ -305,18 +307,26 @@ const Timeline: React.FC<TimelineProps> = (props) => {
       const t = tStart + video.currentTime;
 
       const availableWidth = width - 2 * margin;
-      const dt = 5;
+      const dt = TIMELINE_BUCKET;
       const dx = availableWidth / (tEnd - tStart);
 
       ctx.clearRect(0, 0, width, height);
-      let leftIdx = 0;
+      let bucketIdx = 0;
+      let coverageIdx = 0;
       for (let tLeft = tStart; tLeft < tEnd; tLeft += dt) {
-        let rightIdx = leftIdx;
+        while (coverageIdx < coverage.length && coverage[coverageIdx].t_to < tLeft) {
+          coverageIdx++;
+        }
+        const isCovered = coverageIdx < coverage.length && coverage[coverageIdx].t_from < tLeft + dt;
+        while (bucketIdx < buckets.length && buckets[bucketIdx].t_to <= tLeft) {
+          bucketIdx++;
+        }
         let hasHits = false;
-        while (rightIdx < inferences.length && inferences[rightIdx].t < tLeft + dt) {
-          const hits = inferences[rightIdx].hits.filter((hit) => hit.c >= minConfidence);
-          hasHits = hasHits || hits.length > 0;
-          rightIdx++;
+        let hasInferences = false;
+        for (let i = bucketIdx; i < buckets.length && buckets[i].t_from < tLeft + dt; i++) {
+          const maxC = buckets[i].max_c;
+          hasHits = hasHits || (maxC != null && maxC >= minConfidence);
+          hasInferences = true;
         }
         const x = (tLeft - tStart) * dx;
         const w = dt * dx;
@@ -324,8 +334,8 @@ const Timeline: React.FC<TimelineProps> = (props) => {
           ctx.fillStyle = 'red';
           ctx.strokeStyle = 'none';
           ctx.fillRect(margin + x, 1, w, height - 2);
-        } else if (rightIdx - leftIdx > 0) {
-          // @NOTE: There are inferences but no hits
+        } else if (hasInferences || isCovered) {
+          // @NOTE: There are inferences or coverage but no hits
           ctx.fillStyle = '#333';
           ctx.strokeStyle = 'none';
           ctx.fillRect(margin + x, 1, w, height - 2);
@@ -339,7 +349,6 @@ const Timeline: React.FC<TimelineProps> = (props) => {
           ctx.stroke();
           ctx.closePath();
         }
-        leftIdx = rightIdx;
       }
 
       ctx.fillStyle = 'none';
@@ -355,13 +364,13 @@ const Timeline: React.FC<TimelineProps> = (props) => {
     return () => {
       stop = true;
     };
-  }, [inferences, tKnownStart, minConfidence]);
+  }, [buckets, coverage, tKnownStart, minConfidence]);
 
   return <canvas style={{ height: '100%', width: '100%', display: 'block' }} ref={ref} />;
 };
 
 interface OverlayProps {
-  inferences: GunsAPI.Inference[]; // @DOC: Have to be sorted
+  inferences: StreamedInference[]; // @DOC: Have to be sorted
   videoRef: React.MutableRefObject<HTMLVideoElement | null>;
   tKnownStart?: number;
 }
@@ -423,12 +432,10 @@ const Overlay: React.FC<OverlayProps> = (props) => {
 
       ctx.clearRect(0, 0, width, height);
       const slice = inferences.slice(leftIdx, rightIdx);
-      const renderedHitIds = [];
       for (const inference of slice) {
         const t_a = 1 - (t - inference.t) / fade;
         for (const hit of inference.hits) {
           if (hit.c < minConfidence) continue;
-          renderedHitIds.push(hit.id);
           // const c_a = Math.min(1, (hit.c - cMin) / (cMax - cMin));
           ctx.strokeStyle = `rgba(255, 0, 0, ${t_a})`;
           ctx.lineWidth = 2;
@@ -441,7 +448,7 @@ const Overlay: React.FC<OverlayProps> = (props) => {
       // ctx.font = '20px sans';
       // ctx.fillStyle = 'red';
       // ctx.textBaseline = 'top';
-      // ctx.fillText(renderedHitIds.join(', '), 0, 0);
+      // ctx.fillText(slice.map((it) => it.t).join(', '), 0, 0);
 
       video.requestVideoFrameCallback(drawAndSchedule);
       // requestAnimationFrame(drawAndSchedule);